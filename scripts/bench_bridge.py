@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import sys
+import threading
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voitta.voitta_loop import LoopBridge
+
+
+async def fake_call(delay):
+    """Stand-in for VoittaRouter.call_function"""
+    if delay:
+        await asyncio.sleep(delay)
+    else:
+        await asyncio.sleep(0)
+    return "ok"
+
+
+def thread_per_call(delay):
+    """What the generated dspy wrappers used to do: a thread and a new loop per call"""
+    from asgiref.sync import async_to_sync
+
+    result = None
+
+    def target():
+        nonlocal result
+        result = async_to_sync(fake_call)(delay)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return result
+
+
+def bench(label, fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / calls * 1e6:10.1f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sync-to-async call overhead: thread per call vs. LoopBridge')
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='Simulated I/O time inside each call in seconds')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    bench("thread + async_to_sync", lambda: thread_per_call(args.delay), args.calls)
+
+    bridge = LoopBridge(workers=args.workers)
+    bridge.start()
+    bench(f"LoopBridge ({args.workers} worker)", lambda: bridge.run(fake_call(args.delay)), args.calls)
+    bridge.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import tracemalloc
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voitta.voitta import VoittaRouter, EndpointDescription
+
+
+def synthetic_endpoint(name, n_tools, n_params=4):
+    """Endpoint description with `n_tools` POST tools, built without network access"""
+    tools = []
+    for i in range(n_tools):
+        properties = {
+            f"param_{k}": {"type": "string", "description": f"Parameter {k} of tool {i}"}
+            for k in range(n_params)
+        }
+        tools.append({
+            "path": f"/tool_{i}",
+            "operationId": f"tool_{i}",
+            "name": f"Tool {i}",
+            "description": f"Synthetic tool number {i}",
+            "method": "post",
+            "schema": {"properties": properties, "required": list(properties)},
+            "mtx": "default"
+        })
+    return EndpointDescription.from_dict({
+        "name": name,
+        "description": name,
+        "url": "http://localhost",
+        "info": {"url": "http://localhost"},
+        "prompt": None,
+        "paths": [tool["path"] for tool in tools],
+        "tools": tools
+    })
+
+
+def build_router(n_tools):
+    router = VoittaRouter([])
+    router.endpoints.append(synthetic_endpoint("bench", n_tools))
+    return router
+
+
+def bench(n_tools):
+    # Timings are taken without tracemalloc, which slows allocation down a lot
+    start = time.perf_counter()
+    router = build_router(n_tools)
+    init_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tools = router.dspy_tools
+    build_time = time.perf_counter() - start
+    assert len(tools) == n_tools
+    del router, tools
+
+    tracemalloc.start()
+    router = build_router(n_tools)
+    init_mem = tracemalloc.get_traced_memory()[0]
+    router.dspy_tools
+    build_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{n_tools:>6} tools: init {init_time * 1000:8.1f} ms {init_mem / 2**20:7.1f} MiB | "
+          f"dspy_tools {build_time * 1000:8.1f} ms {(build_mem - init_mem) / 2**20:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Router init time and memory with lazily built dspy tools')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    args = parser.parse_args()
+
+    for n_tools in args.sizes:
+        bench(n_tools)
+
+
+if __name__ == "__main__":
+    main()
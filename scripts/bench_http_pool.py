@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import sys
+import subprocess
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+
+from voitta.voitta import EndpointDescription
+
+
+async def stand_in_app(scope, receive, send):
+    """Minimal ASGI tool server answering every request with a small JSON body"""
+    if scope["type"] != "http":
+        return
+    body = json.dumps({"status": "ok", "data": "pong"}).encode()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def serve(port):
+    import uvicorn
+
+    uvicorn.run(stand_in_app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(port):
+    """Run the stand-in in a separate process so it does not share the GIL"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve",
+                                "--port", str(port)])
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/ping")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("stand-in server did not start")
+
+
+def ping_endpoint(url, http_options=None, app=None, info=None):
+    return EndpointDescription.from_dict({
+        "name": "bench",
+        "description": "bench",
+        "url": url,
+        "info": info or {"url": url},
+        "prompt": None,
+        "paths": ["/ping"],
+        "tools": [{
+            "path": "/ping",
+            "operationId": "ping",
+            "name": "Ping",
+            "description": "Ping",
+            "method": "get",
+            "schema": None,
+            "mtx": "default"
+        }]
+    }, app=app, http_options=http_options)
+
+
+async def run_calls(call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return requests / (time.perf_counter() - start)
+
+
+async def bench(url, requests, concurrency, http2):
+    async def client_per_call():
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{url}/ping")
+            return response.text
+
+    endpoint = ping_endpoint(url, {"http2": http2})
+
+    async def pooled():
+        return await endpoint.call_function("ping", {}, None, None)
+
+    # Warm up both paths once
+    await client_per_call()
+    await pooled()
+
+    rate = await run_calls(client_per_call, requests, concurrency)
+    print(f"new client per call   {rate:10.0f} req/s")
+    rate = await run_calls(pooled, requests, concurrency)
+    print(f"pooled client         {rate:10.0f} req/s")
+
+    # Same tool served by the app in-process through httpx.ASGITransport
+    asgi_endpoint = ping_endpoint(url, app=stand_in_app,
+                                  info={"url": url, "type": "web_client"})
+
+    async def in_process():
+        return await asgi_endpoint.call_function("ping", {}, None, None)
+
+    await in_process()
+    rate = await run_calls(in_process, requests, concurrency)
+    print(f"in-process ASGI       {rate:10.0f} req/s")
+
+    await endpoint.aclose()
+    await asgi_endpoint.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Tool call throughput against a local uvicorn stand-in')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--http2', action='store_true',
+                        help='Enable HTTP/2 on the pooled client (needs the h2 package)')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    server = start_server(args.port)
+    try:
+        asyncio.run(bench(f"http://127.0.0.1:{args.port}",
+                          args.requests, args.concurrency, args.http2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import re
+import subprocess
+import sys
+import argparse
+
+
+# Modules that must not be pulled in by a bare `import voitta`.
+HEAVY_MODULES = [
+    "dspy",
+    "pandas",
+    "fastapi.testclient",
+    "jwt",
+    "jsonpath_ng",
+    "dotenv",
+    "requests",
+    "yaml",
+]
+
+
+def measure_import(module, python=sys.executable):
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        A tuple of (cumulative import time of `module` in microseconds,
+        set of module names imported along the way)
+    """
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr)
+        sys.exit(proc.returncode)
+
+    total = None
+    imported = set()
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)", line)
+        if not match:
+            continue
+        name = match.group(4)
+        imported.add(name)
+        if name == module:
+            total = int(match.group(2))
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Guard the `import voitta` time budget')
+    parser.add_argument('--budget-ms', type=float, default=500.0,
+                        help='Maximum cumulative import time in milliseconds')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of fresh interpreters to sample (best run is used)')
+    args = parser.parse_args()
+
+    best = None
+    imported = set()
+    for _ in range(args.runs):
+        total, imported = measure_import("voitta")
+        if best is None or total < best:
+            best = total
+
+    print(f"import voitta: {best / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    leaked = sorted(m for m in HEAVY_MODULES if m in imported)
+    if leaked:
+        print(f"Error: heavy modules imported eagerly: {', '.join(leaked)}")
+        failed = True
+
+    if best / 1000 > args.budget_ms:
+        print("Error: import time budget exceeded")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
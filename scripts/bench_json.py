@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voitta.voitta_json import BACKENDS, JSONCodec
+
+
+def records(n):
+    """Tool-result-like payload: a status envelope around `n` records"""
+    return {"status": "ok", "data": [
+        {"id": i, "name": f"record {i}", "value": i * 1.5, "active": i % 2 == 0,
+         "tags": ["alpha", "beta"], "owner": {"id": i % 17, "email": f"user{i % 17}@example.com"}}
+        for i in range(n)]}
+
+
+def best(fn, repeat):
+    """Best time of `repeat` runs, in microseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1e6
+
+
+def available_codecs():
+    codecs = []
+    for name in BACKENDS:
+        try:
+            codecs.append(JSONCodec(name))
+        except ImportError:
+            print(f"({name} not installed)")
+    return codecs
+
+
+def bench(sizes, repeat):
+    codecs = available_codecs()
+    print(f"{'payload':>10} {'backend':>8} {'loads us':>12} {'dumps us':>12} {'mcp round trip us':>18}")
+    for n in sizes:
+        payload = records(n)
+        text = JSONCodec("json").dumps(payload)
+        message = ('{"jsonrpc":"2.0","id":"7","result":' + text + '}').encode("utf-8")
+        label = f"{len(text) / 1024:.0f} KiB"
+        for codec in codecs:
+            loads = best(lambda: codec.loads(text), repeat)
+            dumps = best(lambda: codec.dumps(payload), repeat)
+            # What the MCP layer does with a tools/call response
+            round_trip = best(lambda: codec.dumps(codec.loads_message(message)["result"]), repeat)
+            print(f"{label:>10} {codec.backend:>8} {loads:12.1f} {dumps:12.1f} {round_trip:18.1f}")
+
+        for codec in codecs:
+            if codec.backend != "msgspec":
+                continue
+            codec.passthrough = True
+            passthrough = best(lambda: codec.dumps(codec.loads_message(message)["result"]), repeat)
+            codec.passthrough = False
+            print(f"{label:>10} {'msgspec passthrough':>44} {passthrough:13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='JSON codec microbenchmark on tool-result-sized payloads')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000],
+                        help='Number of records per payload')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    bench(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
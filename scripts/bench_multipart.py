@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import asyncio
+import io
+import json
+import os
+import sys
+import pathlib
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+
+from voitta.voitta import EndpointDescription
+
+
+async def stand_in_app(scope, receive, send):
+    """ASGI upload target that drains the request body and reports its size"""
+    if scope["type"] != "http":
+        return
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        size += len(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    body = json.dumps({"status": "ok", "data": {"size": size}}).encode()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def serve(port):
+    import uvicorn
+
+    uvicorn.run(stand_in_app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(port):
+    """Run the stand-in in a separate process so its memory is not counted"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve",
+                                "--port", str(port)])
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/upload")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("stand-in server did not start")
+
+
+def upload_endpoint(url):
+    return EndpointDescription.from_dict({
+        "name": "bench",
+        "description": "bench",
+        "url": url,
+        "info": {"url": url},
+        "prompt": None,
+        "paths": ["/upload"],
+        "tools": [{
+            "path": "/upload",
+            "operationId": "upload",
+            "name": "Upload",
+            "description": "Upload",
+            "method": "post",
+            "schema": {"properties": {"file": {"type": "string", "format": "binary"}}},
+            "mtx": "default"
+        }]
+    })
+
+
+async def measure(label, upload):
+    """Print time and peak memory allocated while `upload()` runs"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = await upload()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = json.loads(result)["data"]["size"]
+    print(f"{label:<28} {elapsed * 1000:8.0f} ms  peak {peak / 2**20:8.1f} MiB  "
+          f"({size / 2**20:.0f} MiB body)")
+
+
+async def bench(url, size_mb):
+    size = size_mb * 2**20
+    text = "x" * size
+    data = b"x" * size
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+    endpoint = upload_endpoint(url)
+    try:
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            async def copying():
+                # What call_function used to do for every binary argument
+                file_obj = io.BytesIO(text.encode("utf8"))
+                response = await client.post(f"{url}/upload",
+                                             files={"file": ("unknown", file_obj, "text/plain")})
+                return response.text
+
+            await measure("str -> BytesIO (copying)", copying)
+
+        await measure("bytes (streamed)", lambda: endpoint.call_function(
+            "upload", {"file": data}, None, None))
+        await measure("memoryview (streamed)", lambda: endpoint.call_function(
+            "upload", {"file": memoryview(data)}, None, None))
+        await measure("path (streamed)", lambda: endpoint.call_function(
+            "upload", {"file": pathlib.Path(path)}, None, None))
+    finally:
+        await endpoint.aclose()
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Peak memory of multipart uploads of binary tool arguments')
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--port', type=int, default=8798)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    server = start_server(args.port)
+    try:
+        asyncio.run(bench(f"http://127.0.0.1:{args.port}", args.size_mb))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voitta.voitta_index import METHODS, ToolIndex
+
+VERBS = ["get", "list", "create", "update", "delete", "search", "export", "import", "sync", "archive"]
+NOUNS = ["invoice", "customer", "order", "ticket", "user", "project", "report", "payment",
+         "shipment", "document", "calendar", "event", "message", "repository", "issue", "metric"]
+WORDS = ["account", "status", "date", "range", "owner", "team", "region", "currency", "amount",
+         "priority", "label", "comment", "file", "folder", "page", "limit", "filter", "query"]
+
+
+def make_tools(n, seed=0):
+    """Synthetic OpenAPI-like catalog of `n` tools"""
+    rng = random.Random(seed)
+    tools = []
+    for i in range(n):
+        verb, noun = rng.choice(VERBS), rng.choice(NOUNS)
+        params = rng.sample(WORDS, 4)
+        tools.append({
+            "type": "function",
+            "function": {
+                "name": f"{i % 50 + 1}____{verb}{noun.capitalize()}{i}",
+                "description": f"{verb.capitalize()} a {noun} by {' and '.join(params[:2])}. "
+                               + " ".join(rng.choice(WORDS) for _ in range(12)),
+                "parameters": {
+                    "type": "object",
+                    "properties": {p: {"type": "string", "description": f"The {noun} {p}"}
+                                   for p in params}
+                }
+            }
+        })
+    return tools
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench(n, queries, top_k):
+    tools = make_tools(n)
+    rng = random.Random(1)
+    texts = [f"{rng.choice(VERBS)} the {rng.choice(NOUNS)} for {rng.choice(WORDS)} {rng.choice(WORDS)}"
+             for _ in range(queries)]
+
+    print(f"{n} tools, {queries} queries, top_k={top_k}")
+    print(f"{'method':>10} {'build ms':>10} {'p50 us':>10} {'p95 us':>10}")
+    for method in METHODS:
+        start = time.perf_counter()
+        index = ToolIndex(tools, method=method)
+        build = (time.perf_counter() - start) * 1000
+
+        times = []
+        for text in texts:
+            start = time.perf_counter()
+            index.select(text, top_k, pinned=["1____*"])
+            times.append((time.perf_counter() - start) * 1e6)
+        print(f"{method:>10} {build:10.0f} {percentile(times, 0.5):10.0f} {percentile(times, 0.95):10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Ranking latency of the tool retrieval index')
+    parser.add_argument('--tools', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=20)
+    args = parser.parse_args()
+
+    bench(args.tools, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
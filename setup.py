@@ -50,7 +50,16 @@ setup(
         "asgiref",
         "uuid",
         "pyjwt"
-    ]
+    ],
+    extras_require={
+        # Faster JSON encoding/decoding; msgspec also enables MCP result passthrough
+        "json": ["orjson", "msgspec"],
+    },
+    entry_points={
+        "console_scripts": [
+            "voitta=voitta.cli:main",
+        ],
+    },
 )
 
 # typing
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, Form
+
+from voitta import VoittaRouter
+
+# tool_call_ids as issued by OpenAI: "call_" and 24 letters or digits
+CALL_A, CALL_B, CALL_C = (f"call_{letter * 24}" for letter in "abc")
+
+
+def make_app(calls):
+    app = FastAPI()
+
+    @app.post("/echo", operation_id="echo", description="Echo a value",
+              openapi_extra={"x-CPM": "default"})
+    async def echo(value: str = Form(...)):
+        calls.append(value)
+        return {"status": "ok", "data": value}
+
+    return app
+
+
+def run_batch(batch, **options):
+    """Run `batch` through a router for the in-process echo app; returns (envelopes, echoed values)"""
+    calls = []
+    app = make_app(calls)
+
+    async def run():
+        router = await VoittaRouter.create(
+            [("demo", {"url": "http://testserver", "type": "web_client"})], app=app, **options)
+        try:
+            return await router.call_functions(batch, None, None, deadline=10)
+        finally:
+            await router.aclose()
+
+    return asyncio.run(run()), calls
+
+
+def test_dependent_call_receives_result_without_reference_store():
+    results, calls = run_batch([
+        ("1____echo", {"value": CALL_A}, CALL_B),
+        ("1____echo", {"value": "hello"}, CALL_A),
+    ])
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert calls[0] == "hello"
+    assert json.loads(json.loads(results[0]["content"])["data"])["data"] == "hello"
+
+
+def test_dependent_call_receives_result_with_reference_store():
+    results, calls = run_batch([
+        ("1____echo", {"value": CALL_A}, CALL_B),
+        ("1____echo", {"value": "hello"}, CALL_A),
+    ], reference_store="memory")
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert calls == ["hello", "hello"]
+
+
+def test_reference_cycle():
+    results, calls = run_batch([
+        ("1____echo", {"value": CALL_B}, CALL_A),
+        ("1____echo", {"value": CALL_A}, CALL_B),
+        ("1____echo", {"value": "independent"}, CALL_C),
+    ])
+    assert [result["status"] for result in results] == ["error", "error", "ok"]
+    assert "Circular reference" in results[0]["message"]
+    assert calls == ["independent"]
+
+
+def test_upstream_failure():
+    results, calls = run_batch([
+        ("1____missing", {"value": "x"}, CALL_A),
+        ("1____echo", {"value": CALL_A}, CALL_B),
+    ])
+    assert [result["status"] for result in results] == ["error", "error"]
+    assert results[1]["message"].startswith(f"Upstream call {CALL_A} failed")
+    assert calls == []
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from voitta import VoittaRouter
+from voitta.voitta import afetch_spec, fetch_spec
+from voitta.voitta_cache import SpecCache
+from voitta.voitta_mcp import MCPServerDescription
+
+URL = "http://specs.test/"
+SPEC = {"openapi": "3.0.0", "paths": {"/__prompt__": {}}}
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/ping", operation_id="ping", description="Ping the server",
+             openapi_extra={"x-CPM": "default"})
+    async def ping():
+        return {"status": "ok"}
+
+    return app
+
+
+def create(**options):
+    app = make_app()
+
+    async def run():
+        router = await VoittaRouter.create(
+            [("demo", {"url": "http://testserver", "type": "web_client"})], app=app, **options)
+        await router.aclose()
+        return router
+
+    return asyncio.run(run())
+
+
+def test_create_with_settings():
+    router = create(settings={"compact_tools": True})
+    assert router.schema_compactor is not None
+    assert len(router.endpoints) == 1
+
+
+def test_create_with_mcp_server_description(tmp_path):
+    path = tmp_path / "mcp.json"
+    path.write_text(json.dumps({"mcpServers": {}}))
+    mcp = MCPServerDescription(str(path))
+    router = create(mcp_config=mcp)
+    assert router.mcp is mcp
+
+
+def spec_handler(requests, status=200):
+    def handler(request):
+        requests.append(request)
+        if status != 200:
+            return httpx.Response(status)
+        if request.url.path == "/__prompt__":
+            return httpx.Response(200, text='"Be brief"')
+        return httpx.Response(200, json=SPEC, headers={"etag": '"v1"'})
+    return handler
+
+
+def test_fetch_spec_caches_and_revalidates(tmp_path):
+    cache = SpecCache(str(tmp_path))
+    requests = []
+    with httpx.Client(transport=httpx.MockTransport(spec_handler(requests))) as client:
+        assert fetch_spec(client, URL, 5, spec_cache=cache) == (SPEC, "Be brief")
+
+    with httpx.Client(transport=httpx.MockTransport(spec_handler(requests, 304))) as client:
+        assert fetch_spec(client, URL, 5, spec_cache=cache) == (SPEC, "Be brief")
+    assert requests[-1].headers["if-none-match"] == '"v1"'
+
+    assert fetch_spec(None, URL, 5, spec_cache=cache, offline=True) == (SPEC, "Be brief")
+
+
+def test_afetch_spec_serves_stale_copy(tmp_path):
+    cache = SpecCache(str(tmp_path))
+    cache.put(URL, SPEC, "cached")
+
+    def fail(request):
+        raise httpx.ConnectError("down")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fail)) as client:
+            stale = await afetch_spec(client, URL, 5, spec_cache=cache)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fail)) as client:
+            try:
+                await afetch_spec(client, URL, 5)
+            except httpx.ConnectError:
+                return stale
+        raise AssertionError("expected ConnectError without a cached spec")
+
+    assert asyncio.run(run()) == (SPEC, "cached")
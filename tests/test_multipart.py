@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, File, Form, UploadFile
+
+from voitta import VoittaRouter
+
+
+def make_app():
+    app = FastAPI()
+
+    # Voitta exposes operations marked with x-CPM
+    @app.post("/upload", operation_id="upload", description="Upload a file",
+              openapi_extra={"x-CPM": "default"})
+    async def upload(file: UploadFile = File(...), asset_name: str = Form(...)):
+        content = await file.read()
+        return {"status": "ok", "data": {"size": len(content), "name": asset_name,
+                                         "head": content[:16].decode("utf-8", errors="replace")}}
+
+    return app
+
+
+def upload_in_process(value):
+    """Upload `value` to an endpoint served in-process through httpx.ASGITransport"""
+    app = make_app()
+
+    async def run():
+        router = await VoittaRouter.create(
+            [("demo", {"url": "http://testserver", "type": "web_client"})], app=app)
+        try:
+            assert router.endpoints[0].in_process
+            return await router.call_function(
+                "1____upload", {"file": value, "asset_name": "x.txt"}, None, None)
+        finally:
+            await router.aclose()
+
+    return json.loads(asyncio.run(run()))
+
+
+def test_str_upload_in_process():
+    result = upload_in_process("hello")
+    assert result["data"] == {"size": 5, "name": "x.txt", "head": "hello"}
+
+
+def test_bytes_upload_in_process():
+    data = b"0123456789abcdef" * 10000
+    result = upload_in_process(data)
+    assert result["data"]["size"] == len(data)
+    assert result["data"]["head"] == "0123456789abcdef"
+
+
+def test_memoryview_upload_in_process():
+    result = upload_in_process(memoryview(b"hello world"))
+    assert result["data"]["size"] == 11
@@ -0,0 +1,88 @@
+import asyncio
+import sqlite3
+import threading
+
+from voitta import VoittaRouter
+from voitta.voitta_references import (RETRIEVE_VALUES_OPERATION, HTTPReferenceStore,
+                                      SQLiteReferenceStore)
+
+
+def run_with_timeout(coroutine, timeout=10):
+    """Run `coroutine` in its own thread; fail instead of hanging if it deadlocks"""
+    result = {}
+
+    def target():
+        result["value"] = asyncio.run(coroutine)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "deadlocked"
+    return result["value"]
+
+
+def test_close_from_coroutine_with_pending_writes():
+    async def run():
+        router = VoittaRouter([], reference_store="memory", write_behind={"flush_interval": 0.5})
+        store = router.reference_store
+        router.bridge.run(store.put("call_bridge", "from bridge"))
+        # Queued on this loop, which is blocked while close() runs
+        await store.put("call_app", "from app")
+        router.close()
+        assert await store.store.get_many(["call_bridge"]) == {"call_bridge": "from bridge"}
+        await router.aclose()
+        return await store.store.get_many(["call_app"])
+
+    assert run_with_timeout(run()) == {"call_app": "from app"}
+
+
+def blob_count(store):
+    return store._connection.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+
+def test_sqlite_replace_deletes_unreferenced_value(tmp_path):
+    store = SQLiteReferenceStore(str(tmp_path / "refs.db"))
+    store.put_many_sync([("a", "first"), ("b", "shared")])
+    store.put_many_sync([("a", "second"), ("c", "shared")])
+    assert blob_count(store) == 2
+    assert store.get_many_sync(["a", "b", "c"]) == {"a": "second", "b": "shared", "c": "shared"}
+
+
+def test_sqlite_evicts_least_recently_used(tmp_path):
+    value = "x" * 1000
+    store = SQLiteReferenceStore(str(tmp_path / "refs.db"), max_bytes=2500)
+    store.put_many_sync([("a", value + "a")])
+    store.put_many_sync([("b", value + "b")])
+    store.get_many_sync(["a"])
+    store.put_many_sync([("c", value + "c")])
+    assert set(store.get_many_sync(["a", "b", "c"])) == {"a", "c"}
+    assert store.size <= 2500
+    assert blob_count(store) == 2
+
+
+def test_sqlite_opens_database_without_access_times(tmp_path):
+    path = str(tmp_path / "refs.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE refs (key TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+    connection.execute("CREATE TABLE blobs (digest TEXT PRIMARY KEY, value BLOB NOT NULL)")
+    connection.execute("INSERT INTO blobs VALUES ('orphan', '1')")
+    connection.commit()
+    connection.close()
+
+    store = SQLiteReferenceStore(path)
+    assert blob_count(store) == 0
+    store.put_many_sync([("a", 1)])
+    assert store.get_many_sync(["a"]) == {"a": 1}
+
+
+class ErrorEndpoint:
+    """Reference provider whose batch operation answers with an error envelope"""
+    operationIds = {RETRIEVE_VALUES_OPERATION: 0}
+
+    async def call_function(self, name, arguments, token, oauth_token):
+        return '{"status": "error", "message": "boom"}'
+
+
+def test_http_batch_error_envelope_is_missing():
+    store = HTTPReferenceStore(ErrorEndpoint())
+    assert asyncio.run(store.get_many(["call_a", "call_b"])) == {}
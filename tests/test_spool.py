@@ -0,0 +1,48 @@
+import asyncio
+
+from fastapi import FastAPI
+
+from voitta import VoittaRouter
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/report", operation_id="report", description="Get a large report",
+             openapi_extra={"x-CPM": "default"})
+    async def report():
+        return {"status": "ok", "data": "x" * 10000}
+
+    @app.delete("/items/{item_id}", operation_id="delete_item", description="Delete an item",
+                openapi_extra={"x-CPM": "default"})
+    async def delete_item(item_id: str):
+        return {"status": "ok"}
+
+    return app
+
+
+def call_with_spool(name, arguments):
+    """Call tool `name` of the in-process app through a router with a small result spool"""
+    app = make_app()
+
+    async def run():
+        router = await VoittaRouter.create(
+            [("demo", {"url": "http://testserver", "type": "web_client"})], app=app,
+            result_spool={"threshold": 1000, "preview_bytes": 100})
+        try:
+            return await router.call_function(name, arguments, None, None)
+        finally:
+            await router.aclose()
+
+    return asyncio.run(run())
+
+
+def test_large_result_is_spooled():
+    result = call_with_spool("1____report", {})
+    assert len(result) < 10000
+    assert "x" * 100 not in result
+
+
+def test_unsupported_method_with_spool():
+    result = call_with_spool("1____delete_item", {"item_id": "a"})
+    assert "Not implemented yet (delete)" in result
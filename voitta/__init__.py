@@ -1,3 +1,13 @@
 from .voitta import VoittaRouter, VoittaResponse
 from .voitta_canvas import CanvasDescription
 from .voitta_mcp import MCPServerDescription
+from .voitta_cache import SpecCache, ResponseCache
+from .voitta_snapshot import read_snapshot
+from .voitta_loop import LoopBridge
+from .voitta_singleflight import SingleFlight
+from .voitta_spool import ResultSpool
+from .voitta_tables import ResultTables, Table
+from .voitta_json import JSONCodec
+from .voitta_index import ToolIndex
+from .voitta_compact import SchemaCompactor
+from .voitta_references import ReferenceStore, MemoryReferenceStore, SQLiteReferenceStore, HTTPReferenceStore, WriteBehindReferenceStore
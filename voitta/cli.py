@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import sys
+
+from .voitta import VoittaRouter, parse_config
+from .voitta_snapshot import build_snapshot, read_snapshot
+
+
+async def _build_router(config, args):
+    return await VoittaRouter.create(config, timeout=args.timeout, deadline=args.deadline)
+
+
+def _missing_endpoints(config, router):
+    """Names of configured endpoints that could not be fetched"""
+    endpoints, _ = parse_config(config)
+    return [name for name, info in endpoints
+            if info["url"] != "canvas" and name not in router.endpoint_directory]
+
+
+async def _compile(args):
+    router = await _build_router(args.config, args)
+    try:
+        missing = _missing_endpoints(args.config, router)
+        if missing and not args.allow_partial:
+            print(f"Could not fetch endpoint(s): {', '.join(missing)}; no snapshot written "
+                  f"(use --allow-partial to compile without them)", file=sys.stderr)
+            return 1
+        snapshot = router.save_snapshot(args.output)
+    finally:
+        if router.mcp is not None:
+            await router.mcp.stop_all()
+
+    if missing:
+        print(f"Warning: compiled without endpoint(s): {', '.join(missing)}", file=sys.stderr)
+    print(f"Compiled {len(snapshot['tools'])} tool(s) from "
+          f"{len(snapshot['endpoints'])} endpoint(s) to {args.output}")
+    print(f"Catalog fingerprint: {snapshot['catalog_fingerprint']}")
+    return 0
+
+
+async def _check(args):
+    snapshot = read_snapshot(args.snapshot)
+
+    router = await _build_router(args.config, args)
+    try:
+        current = build_snapshot(router)
+    finally:
+        if router.mcp is not None:
+            await router.mcp.stop_all()
+
+    stale = False
+    if current["config_fingerprint"] != snapshot["config_fingerprint"]:
+        print("Configuration has changed since the snapshot was compiled")
+        stale = True
+    if current["catalog_fingerprint"] != snapshot["catalog_fingerprint"]:
+        print("Tool catalog has changed since the snapshot was compiled")
+        stale = True
+
+    if not stale:
+        print(f"{args.snapshot} is up to date")
+    return 1 if stale else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="voitta", description="Voitta command line tools")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    compile_parser = subparsers.add_parser(
+        "compile", help="Fetch all endpoints and write a precompiled tool catalog")
+    compile_parser.add_argument("config", help="Path to voitta.yaml")
+    compile_parser.add_argument("-o", "--output", default="catalog.bin",
+                                help="Snapshot file to write")
+    compile_parser.add_argument("--allow-partial", action="store_true",
+                                help="Write the snapshot even if some endpoints could not be fetched")
+
+    check_parser = subparsers.add_parser(
+        "check", help="Exit with status 1 if a catalog snapshot is stale")
+    check_parser.add_argument("config", help="Path to voitta.yaml")
+    check_parser.add_argument("snapshot", help="Snapshot file to verify")
+
+    for sub in (compile_parser, check_parser):
+        sub.add_argument("--timeout", type=float, default=5,
+                         help="Per-request timeout in seconds")
+        sub.add_argument("--deadline", type=float, default=30,
+                         help="Overall deadline for fetching all endpoints")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        return asyncio.run(_compile(args))
+    return asyncio.run(_check(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
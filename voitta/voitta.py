@@ -1,38 +1,73 @@
-import jwt
-import datetime
 import os
 import sys
-import io
-import yaml
-from fastapi.testclient import TestClient
-import requests
 import json
-import pandas as pd
-from jsonpath_ng import parse
+import asyncio
+import inspect
+import threading
+import uuid
 import httpx
 import urllib.parse
 import re
 import time
+import zlib
+import hashlib
+import collections
+import concurrent.futures
+from types import MappingProxyType
 
 
 from .voitta_canvas import CanvasDescription
 from .voitta_mcp import MCPServerDescription
-
-import dspy
-import textwrap
+from .voitta_cache import SpecCache, get_spec_cache, get_response_cache, make_key
+from .voitta_loop import LoopBridge, LoopLocal
+from . import voitta_json
+from .voitta_singleflight import SingleFlight
+from .voitta_stream import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_BUFFER, read_ahead
+from .voitta_multipart import MultipartEncoder, upload_file
+from .voitta_spool import DEFAULT_PAGE_BYTES, get_result_spool
+from .voitta_tables import get_result_tables
+from .voitta_index import ToolIndex, get_tool_index_options
+from .voitta_compact import SchemaCompactor, get_schema_compactor
+from .voitta_references import HTTPReferenceStore, WriteBehindReferenceStore, get_reference_store
+from .voitta_snapshot import config_fingerprint, build_snapshot, write_snapshot, read_snapshot, canonical_json
 
 from pydantic import BaseModel, Extra
 from typing import Any, Optional, Dict, List
 
-from dotenv import load_dotenv
+import traceback
 
-from asgiref.sync import async_to_sync
+# Heavy dependencies (yaml, requests, fastapi.testclient, jsonpath_ng, dotenv)
+# are imported inside the code paths that need them so that `import voitta`
+# stays cheap. See scripts/bench_import.py for the import-time budget.
+
+_jsonpath_expr = None
+
+# Where an exposed tool name is dispatched to: kind is "endpoint", "canvas" or "mcp",
+# function_name is the name the target knows the tool by
+ToolRoute = collections.namedtuple("ToolRoute", "kind target function_name")
 
-import traceback
 
-load_dotenv()
+def stable_endpoint_id(name, delimiter="____"):
+    """
+    Tool name prefix for an endpoint that depends only on its name: the name
+    itself if it is a safe identifier, otherwise a sanitized version with a
+    checksum of the original name appended
+    """
+    sanitized = re.sub(r"[^a-zA-Z0-9_-]", "_", name)
+    if (sanitized != name or sanitized.isdigit() or sanitized == "mcp"
+            or delimiter in sanitized or not sanitized):
+        sanitized = f"{sanitized}_{zlib.crc32(name.encode('utf-8')):08x}"
+    return sanitized
+
+
+def get_ref_expr():
+    """Compiled `$..['$ref']` JSONPath expression, built on first use"""
+    global _jsonpath_expr
+    if _jsonpath_expr is None:
+        from jsonpath_ng import parse
+        _jsonpath_expr = parse("$..['$ref']")
+    return _jsonpath_expr
 
-jsonpath_expr = parse("$..['$ref']")
 
 def voitta_log(message):
     return
@@ -44,9 +79,11 @@ def urljoin(*parts):
 def get_http_client(app=None, _type=""):
     if app is None or _type not in ["web_client"]:
         print ("[Voitta] http client is requests")
+        import requests
         client = requests
     else:
         print ("[Voitta] http client is TestClient")
+        from fastapi.testclient import TestClient
         client = TestClient(app)
     return client
 
@@ -68,7 +105,9 @@ class ToolDescriptor:
                  description,
                  method,
                  schema,
-                 mtx="default"):
+                 mtx="default",
+                 cache_ttl=None,
+                 singleflight=None):
         self.operationId = operationId
         self.name = name
         self.description = description
@@ -76,11 +115,175 @@ class ToolDescriptor:
         self.schema = schema
         self.path = path
         self.mtx=mtx
+        # Response cache lifetime in seconds from the `x-voitta-cache-ttl` extension
+        self.cache_ttl = cache_ttl
+        # `x-voitta-singleflight`: overrides whether identical concurrent calls are coalesced
+        self.singleflight = singleflight
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "operationId": self.operationId,
+            "name": self.name,
+            "description": self.description,
+            "method": self.method,
+            "schema": self.schema,
+            "mtx": self.mtx,
+            "cache_ttl": self.cache_ttl,
+            "singleflight": self.singleflight
+        }
+
+
+def _spec_requests(url, spec_cache=None, offline=False):
+    """
+    Cache and revalidation logic shared by fetch_spec and afetch_spec.
+
+    A generator that yields (url, headers) for each GET it needs, is sent the
+    response (or thrown the exception of a failed request), and returns
+    (openapi document, prompt text or None).
+    """
+    entry = spec_cache.get(url) if spec_cache is not None else None
+
+    if offline:
+        if entry is None:
+            raise ValueError(f"No cached spec for {url} (offline mode)")
+        return entry["openapi"], entry["prompt"]
+
+    try:
+        response = yield urljoin(url, "openapi.json"), SpecCache.conditional_headers(entry)
+        if response.status_code == 304 and entry is not None:
+            voitta_log(f"spec not modified: {url}")
+            return entry["openapi"], entry["prompt"]
+        response.raise_for_status()
+        openapi = response.json()
+
+        prompt = None
+        if "/__prompt__" in openapi["paths"]:
+            prompt_response = yield urljoin(url, "__prompt__"), None
+            prompt = prompt_response.text.strip('"')
+    except Exception as e:
+        if entry is None:
+            raise
+        voitta_log(f"serving stale spec for {url}: {e}")
+        return entry["openapi"], entry["prompt"]
+
+    if spec_cache is not None:
+        spec_cache.put(url, openapi, prompt, response.headers)
+
+    return openapi, prompt
+
+
+def fetch_spec(client, url, timeout, spec_cache=None, offline=False):
+    """
+    Download openapi.json (and __prompt__ if the server advertises it) for an endpoint.
+
+    With a spec cache the request is conditional, and the cached copy is served
+    when the server answers 304 or cannot be reached. In offline mode only the
+    cache is consulted.
+
+    Returns:
+        A tuple of (openapi document, prompt text or None)
+    """
+    steps = _spec_requests(url, spec_cache, offline)
+    try:
+        request_url, headers = next(steps)
+        while True:
+            try:
+                response = client.get(request_url, timeout=timeout, headers=headers)
+            except Exception as e:
+                request_url, headers = steps.throw(e)
+            else:
+                request_url, headers = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def afetch_spec(client, url, timeout, spec_cache=None, offline=False):
+    """Async version of fetch_spec that runs on a shared httpx.AsyncClient"""
+    steps = _spec_requests(url, spec_cache, offline)
+    try:
+        request_url, headers = next(steps)
+        while True:
+            try:
+                response = await client.get(request_url, timeout=timeout, headers=headers)
+            except Exception as e:
+                request_url, headers = steps.throw(e)
+            else:
+                request_url, headers = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+# Top-level voitta.yaml sections that configure the router rather than an endpoint
+ROUTER_SETTINGS = ["mcp_config", "spec_cache", "http", "reference_store", "response_cache",
+                   "result_spool", "result_tables", "tool_index", "compact_tools",
+                   "endpoint_ids"]
+
+
+def parse_config(endpoints):
+    """
+    Normalize router configuration given either as a YAML file path or a list
+    of (name, info) tuples.
+
+    Returns:
+        A tuple of (endpoints, settings) where settings holds the router-level
+        sections (see ROUTER_SETTINGS) found in the YAML file
+    """
+    settings = {}
+
+    if type(endpoints) == str:
+        import yaml
+        from dotenv import load_dotenv
+        load_dotenv()
+
+        with open(endpoints, "r") as file:
+            voitta_config = yaml.safe_load(file)
+
+        # Extract MCP configuration, spec cache configuration
+        # (e.g. {path: ~/.cache/voitta, offline: false}) and so on
+        for key in ROUTER_SETTINGS:
+            if key in voitta_config:
+                settings[key] = voitta_config.pop(key)
+
+        endpoints = [(r, voitta_config[r]) for r in voitta_config]
+
+    if type(endpoints) != list:
+        raise ValueError(
+            "Error parsing endpoints, either a yaml file or a valid list needed")
+
+    return endpoints, settings
+
+
+def resolve_spec_cache(spec_cache, offline, settings):
+    """Combine spec cache arguments with the `spec_cache` YAML section"""
+    cache_config = settings.get("spec_cache")
+    if spec_cache is None:
+        spec_cache = cache_config
+    if isinstance(cache_config, dict):
+        offline = offline or cache_config.get("offline", False)
+
+    spec_cache = get_spec_cache(spec_cache)
+    if offline and spec_cache is None:
+        raise ValueError("Offline mode requires a spec cache")
+    return spec_cache, offline
+
+
+DEFAULT_HTTP_OPTIONS = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 5.0,
+    "http2": False
+}
 
 
 class EndpointDescription:
-    def __init__(self, name, description, url, info, app=None):
+    def __init__(self, name, description, url, info, app=None, spec_cache=None, offline=False,
+                 spec=None, http_options=None, response_cache=None):
         self.timeout = 5
+        self.http_options = {**DEFAULT_HTTP_OPTIONS, **(http_options or {}),
+                             **info.get("http", {})}
+        self._clients = LoopLocal()
+        self.response_cache = response_cache
         self.info = info
         self.url = url
         self.name = name
@@ -89,15 +292,20 @@ class EndpointDescription:
         self.operationIds = {}
         self.prompt = None
         self.app = app
-        self.client = get_http_client(app, info.get("type", ""))
-        self.openapi = self.client.get ( urljoin(url,"openapi.json"), timeout=self.timeout).json()
+        if spec is None:
+            self.client = get_http_client(app, info.get("type", ""))
+            spec = fetch_spec(
+                self.client, url, self.timeout, spec_cache=spec_cache, offline=offline)
+        else:
+            # Spec was already fetched (see VoittaRouter.create)
+            self.client = None
+        self.openapi, prompt = spec
         self.paths = []
 
         for path in self.openapi["paths"]:
             self.paths.append(path)
             if path == "/__prompt__":
-                self.prompt = self.client.get(
-                    urljoin(url, "__prompt__"), timeout=self.timeout ).text.strip('"')
+                self.prompt = prompt or ""
 
                 match = ('{"message":"Result for ivan"}' in self.prompt)
                 if match:
@@ -117,7 +325,7 @@ class EndpointDescription:
                     else:
                         rb = True
                         requestBody = path_data[method]["requestBody"]
-                        matches = jsonpath_expr.find(requestBody)
+                        matches = get_ref_expr().find(requestBody)
                         value = matches[0].value
                         schema_name = value.split("/")[-1]
                         schema = self.openapi["components"]["schemas"][schema_name]
@@ -131,36 +339,161 @@ class EndpointDescription:
                         description=path_data[method]["description"],
                         method=method,
                         schema=schema,
-                        mtx=mtx
+                        mtx=mtx,
+                        cache_ttl=path_data[method].get("x-voitta-cache-ttl"),
+                        singleflight=path_data[method].get("x-voitta-singleflight")
                     )
 
                     self.operationIds[path_data[method]
                                       ["operationId"]] = len(self.tools)
                     self.tools.append(tool)
 
-                    matches = jsonpath_expr.find(path_data[method])
 
-    async def call_function(self, name, arguments, token, oauth_token):
-        voitta_log(f"call_function: {name} ::: {self.operationIds} ::: {arguments}")
-        if name not in self.operationIds:
-            raise ValueError(f"Name {name} not found")
-
-        tool_id = self.operationIds[name]
-        tool = self.tools[tool_id]
-
-        if token is not None:
-            headers = {"Authorization": f"{token}",
-                       "oauthtoken": f"{oauth_token}"}
-        else:
-            headers = None
+    def to_dict(self):
+        """Parsed endpoint state, without the raw OpenAPI document"""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "url": self.url,
+            "info": self.info,
+            "prompt": self.prompt,
+            "paths": self.paths,
+            "tools": [tool.to_dict() for tool in self.tools]
+        }
 
+    @classmethod
+    def from_dict(cls, data, app=None, http_options=None, response_cache=None):
+        """Rebuild an endpoint from `to_dict` output without any network access"""
+        endpoint = cls.__new__(cls)
+        endpoint.timeout = 5
+        endpoint.http_options = {**DEFAULT_HTTP_OPTIONS, **(http_options or {}),
+                                 **data["info"].get("http", {})}
+        endpoint._clients = LoopLocal()
+        endpoint.response_cache = response_cache
+        endpoint.info = data["info"]
+        endpoint.url = data["url"]
+        endpoint.name = data["name"]
+        endpoint.description = data["description"]
+        endpoint.prompt = data["prompt"]
+        endpoint.app = app
+        endpoint.client = None
+        endpoint.openapi = None
+        endpoint.paths = data["paths"]
+        endpoint.tools = [ToolDescriptor(**tool) for tool in data["tools"]]
+        endpoint.operationIds = {
+            tool.operationId: i for i, tool in enumerate(endpoint.tools)}
+        return endpoint
+
+    @property
+    def in_process(self):
+        """True if calls are dispatched straight into `app` instead of over sockets"""
+        return self.app is not None and self.info.get("type", "") == "web_client"
+
+    def _create_async_client(self):
+        if self.in_process:
+            # Co-located tool server: hand requests to the ASGI app directly,
+            # the app does not need to listen on a socket at all
+            return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app))
+
+        options = self.http_options
+        limits = httpx.Limits(
+            max_connections=options["max_connections"],
+            max_keepalive_connections=options["max_keepalive_connections"],
+            keepalive_expiry=options["keepalive_expiry"])
+        return httpx.AsyncClient(limits=limits, http2=options["http2"])
+
+    def get_async_client(self):
+        """Long-lived httpx.AsyncClient for the running event loop"""
+        return self._clients.get(self._create_async_client)
+
+    async def aclose(self):
+        """Close the pooled clients of this endpoint"""
+        current_loop = asyncio.get_running_loop()
+        for loop, client in self._clients.pop_all():
+            if loop is current_loop:
+                await client.aclose()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(future), timeout=5)
+                except Exception as e:
+                    voitta_log(f"Error closing client of {self.name}: {e}")
+
+    def cache_ttl(self, tool):
+        """
+        Response cache lifetime of a GET tool: voitta.yaml `cache.tools.<operationId>`,
+        then `cache.ttl`, then the OpenAPI `x-voitta-cache-ttl` extension, then the
+        cache default
+        """
+        cache_config = self.info.get("cache", {})
+        if cache_config is False:
+            return 0
+        ttl = cache_config.get("tools", {}).get(tool.operationId)
+        if ttl is None:
+            ttl = cache_config.get("ttl")
+        if ttl is None:
+            ttl = tool.cache_ttl
+        if ttl is None and self.response_cache is not None:
+            ttl = self.response_cache.default_ttl
+        return ttl or 0
+
+    def is_cached(self, name):
+        """True if responses of tool `name` go through the response cache"""
+        if self.response_cache is None or name not in self.operationIds:
+            return False
+        tool = self.tools[self.operationIds[name]]
+        return tool.method == "get" and self.cache_ttl(tool) > 0
+
+    def is_idempotent(self, name):
+        """
+        True if identical concurrent calls of tool `name` may share one request:
+        GET tools unless `x-voitta-singleflight: false`, other methods only with
+        `x-voitta-singleflight: true`. `singleflight: false` in voitta.yaml opts
+        out the whole endpoint.
+        """
+        if self.info.get("singleflight") is False or name not in self.operationIds:
+            return False
+        tool = self.tools[self.operationIds[name]]
+        if tool.singleflight is not None:
+            return bool(tool.singleflight)
+        return tool.method == "get"
+
+    async def _get(self, url, headers, tool, arguments, token, oauth_token):
+        """GET through the response cache, if one is configured for this tool"""
+        cache = self.response_cache
+        ttl = self.cache_ttl(tool) if cache is not None else 0
+        if ttl <= 0:
+            response = await self.get_async_client().get(url, headers=headers)
+            return response.text
+
+        key = cache.make_key(self.url, tool.operationId, arguments, token, oauth_token)
+        entry, fresh = cache.lookup(key)
+        if fresh:
+            cache.hits += 1
+            return entry["text"]
+
+        request_headers = dict(headers or {})
+        if entry is not None and entry["etag"]:
+            request_headers["If-None-Match"] = entry["etag"]
+
+        response = await self.get_async_client().get(url, headers=request_headers)
+        if response.status_code == 304 and entry is not None:
+            cache.hits += 1
+            cache.refresh(entry, response.headers)
+            return entry["text"]
+
+        cache.misses += 1
+        if 200 <= response.status_code < 300:
+            cache.store(key, response.text, ttl, response.headers)
+        return response.text
+
+    def _request_arguments(self, tool, arguments, headers):
+        """Keyword arguments of the httpx request that calls `tool`, or None if its method is not supported"""
         if tool.method == "get":
             url = urljoin(self.url, tool.path)
 
             if tool.schema is None or len(tool.schema) == 0:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(url, headers=headers)
-                    return response.text
+                return {"method": "GET", "url": url, "headers": headers}
             else:
                 encoded_arguments = {
                     key: urllib.parse.quote(value, safe='') if type(
@@ -171,25 +504,19 @@ class EndpointDescription:
 
                 url = urljoin(self.url, formatted_path)
 
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(url, headers=headers)
-                    return response.text
+                return {"method": "GET", "url": url, "headers": headers}
         elif tool.method == "post":
             
             url = urljoin(self.url, tool.path)
 
             if tool.schema is None or len(tool.schema) == 0:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(url, headers=headers)
-                    return response.text
+                return {"method": "POST", "url": url, "headers": headers}
             else:
                 url = urljoin ( self.url, tool.path )
 
                 data = {}
                 files = {}
 
-                asset_name = arguments.get("asset_name", "unknown")
-
                 voitta_log(f"call function/tool.schema: {tool.schema}")
 
                 for argument in arguments:
@@ -206,23 +533,77 @@ class EndpointDescription:
                                 arg_descriptor = arg
                                 break
 
-                    if "format" in arg_descriptor and arg_descriptor["format"] == "binary":
-                        file_obj = io.BytesIO(
-                            arguments[argument].encode("utf8"))
-                        files[argument] = (asset_name, file_obj, "text/plain")
+                    # OpenAPI 3.0 marks file fields `format: binary`, 3.1 uses contentMediaType
+                    if arg_descriptor.get("format") == "binary" or "contentMediaType" in arg_descriptor:
+                        # str, bytes, memoryview, a path, a file or an async iterator;
+                        # streamed into the body without copying it first
+                        files[argument] = upload_file(arguments[argument], arguments.get("asset_name"))
                     else:
                         data[argument] = arguments[argument]
 
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(url, headers=headers,
-                                                 data=data,
-                                                 files=files,
-                                                 timeout=60.0)
+                if not files:
+                    return {"method": "POST", "url": url, "headers": headers,
+                            "data": data, "timeout": 60.0}
 
-                return response.text
+                body = MultipartEncoder(data, files)
+                return {"method": "POST", "url": url,
+                        "headers": dict(headers or {}, **body.headers()),
+                        "content": body, "timeout": 60.0}
         else:
-            url = urljoin(self.url, tool.path)
+            return None
+
+    def _prepare_call(self, name, arguments, token, oauth_token):
+        """Look up tool `name` and build its request; returns (tool, headers, request)"""
+        # Only argument names: formatting the values would copy large uploads
+        voitta_log(f"call_function: {name} ::: {list(arguments)}")
+        if name not in self.operationIds:
+            raise ValueError(f"Name {name} not found")
+
+        tool_id = self.operationIds[name]
+        tool = self.tools[tool_id]
+
+        if token is not None:
+            headers = {"Authorization": f"{token}",
+                       "oauthtoken": f"{oauth_token}"}
+        else:
+            headers = None
+
+        return tool, headers, self._request_arguments(tool, arguments, headers)
+
+    async def call_function(self, name, arguments, token, oauth_token):
+        tool, headers, request = self._prepare_call(name, arguments, token, oauth_token)
+
+        if request is None:
             return f"Not implemented yet ({tool.method})"
+        if tool.method == "get":
+            return await self._get(request["url"], headers, tool, arguments, token, oauth_token)
+
+        response = await self.get_async_client().request(**request)
+        return response.text
+
+    async def stream_function(self, name, arguments, token, oauth_token,
+                              chunk_size=DEFAULT_CHUNK_SIZE, max_buffer=DEFAULT_MAX_BUFFER):
+        """
+        Call tool `name` and yield the response body as bytes chunks of up to
+        `chunk_size`, without buffering the whole body. The response cache and
+        single-flight are bypassed.
+        """
+        tool, headers, request = self._prepare_call(name, arguments, token, oauth_token)
+        if request is None:
+            raise ValueError(f"Method {tool.method} of {name} is not supported")
+        async for chunk in self.stream_request(request, chunk_size, max_buffer):
+            yield chunk
+
+    async def stream_request(self, request, chunk_size=DEFAULT_CHUNK_SIZE,
+                             max_buffer=DEFAULT_MAX_BUFFER):
+        """Send `request` (as built by _prepare_call) and yield the response body in chunks"""
+        async def chunks():
+            async with self.get_async_client().stream(**request) as response:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+
+        async for chunk in read_ahead(chunks(), max_buffer, chunk_size):
+            yield chunk
 
     def get_tools(self, prefix, delimiter):
         result = []
@@ -298,34 +679,241 @@ class EndpointDescription:
         return result
 
 
+DSPY_TYPE_MAP = {
+    "boolean": bool,
+    "string": str,
+    "integer": int,
+    "number": float,
+    "array": list,
+    "object": dict
+}
+
+
+def make_tool_function(router, tool):
+    """
+    Build a plain Python function for a tool definition (as returned by get_tools).
+
+    The function carries the tool's signature, annotations and docstring so that
+    dspy can introspect it, and forwards calls to router.call_function.
+    """
+    function_name = tool["function"]["name"]
+    function_desc = tool["function"]["description"]
+    properties = tool["function"].get("parameters", {}).get("properties", {})
+
+    parameters = []
+    annotations = {}
+    p_long = []
+    for parameter_name, parameter in properties.items():
+        parameter_type = DSPY_TYPE_MAP.get(parameter.get("type"), str)
+        parameters.append(inspect.Parameter(
+            parameter_name, inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            annotation=parameter_type))
+        annotations[parameter_name] = parameter_type
+        p_long.append(
+            f"{parameter_name} ({parameter_type.__name__}): {parameter.get('description', '')}")
+    annotations["return"] = str
+
+    signature = inspect.Signature(parameters, return_annotation=str)
+    is_canvas = function_name[0] == "0"
+
+    def the_function(*args, **kwargs):
+        arguments = dict(signature.bind(*args, **kwargs).arguments)
+        call_id = str(uuid.uuid4())
+        token = router.cl if is_canvas else ''
+        return router.bridge.run(
+            router.call_function(function_name, arguments, token, '', call_id))
+
+    the_function.__name__ = f"f_{function_name}"
+    the_function.__qualname__ = the_function.__name__
+    the_function.__signature__ = signature
+    the_function.__annotations__ = annotations
+    if p_long:
+        the_function.__doc__ = f"{function_desc}\n\nParameters:\n" + "\n".join(p_long)
+    else:
+        the_function.__doc__ = function_desc
+
+    return the_function
+
+
+REFERENCE_PATTERN = re.compile(r"^call_[A-Za-z0-9]{24}$")
+
+
+def find_references(value):
+    """Unique `call_...` reference values anywhere in (nested) tool call arguments"""
+    references = []
+
+    def walk(value):
+        if type(value) == str:
+            if REFERENCE_PATTERN.match(value) and value not in references:
+                references.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                walk(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(value)
+    return references
+
+
+def substitute_references(value, values):
+    """
+    Copy of `value` with every reference found in `values` replaced by its value;
+    strings that only look like references (not in `values`) are left as they are
+    """
+    if type(value) == str:
+        return values.get(value, value) if REFERENCE_PATTERN.match(value) else value
+    if isinstance(value, dict):
+        return {key: substitute_references(item, values) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [substitute_references(item, values) for item in value]
+    return value
+
+
+def find_cycles(dependencies):
+    """
+    Indices of calls that can never run because they are on (or wait for) a
+    dependency cycle; `dependencies[i]` lists the calls that call i waits for.
+    """
+    remaining = {i: set(deps) for i, deps in enumerate(dependencies)}
+    ready = [i for i, deps in remaining.items() if not deps]
+    waiting_on = {}
+    for i, deps in remaining.items():
+        for j in deps:
+            waiting_on.setdefault(j, []).append(i)
+
+    while ready:
+        j = ready.pop()
+        for i in waiting_on.get(j, []):
+            remaining[i].discard(j)
+            if not remaining[i]:
+                ready.append(i)
+        remaining[j] = None
+
+    return {i for i, deps in remaining.items() if deps}
+
+
+def normalize_tool_call(call):
+    """Turn a batch entry into a (name, arguments, tool_call_id) tuple"""
+    if isinstance(call, dict):
+        name = call["name"]
+        arguments = call.get("arguments", {})
+        tool_call_id = call.get("tool_call_id", call.get("id", ""))
+    else:
+        name, arguments, tool_call_id = call
+
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments) if arguments.strip() else {}
+    if arguments and not isinstance(arguments, dict):
+        raise ValueError(f"Arguments must be an object, not {type(arguments).__name__}")
+
+    return name, arguments or {}, tool_call_id or ""
+
+
+def tool_call_identity(call):
+    """Best-effort (name, tool_call_id) of a batch entry that could not be normalized"""
+    if isinstance(call, dict):
+        return call.get("name"), call.get("tool_call_id", call.get("id", "")) or ""
+    if isinstance(call, (list, tuple)) and len(call) == 3:
+        return call[0], call[2] or ""
+    return None, ""
+
+
+def tool_call_result(tool_call_id, name, content=None, error=None):
+    """Per-call envelope returned by VoittaRouter.call_functions"""
+    if error is not None:
+        return {"tool_call_id": tool_call_id, "name": name,
+                "status": "error", "message": error}
+    return {"tool_call_id": tool_call_id, "name": name,
+            "status": "ok", "content": content}
+
+
 class VoittaRouter:
-    def __init__(self, endpoints, tool_delimiter="____", mcp_config=None, app=None):
+    def __init__(self, endpoints, tool_delimiter="____", mcp_config=None, app=None,
+                 spec_cache=None, offline=False, prefetched=None, bridge_workers=1,
+                 http_options=None, settings=None, max_concurrent_calls=None,
+                 reference_store=None, write_behind=None, response_cache=None,
+                 single_flight=True, result_spool=None, result_tables=None, tool_index=None,
+                 compact_tools=None, endpoint_ids=None):
         self.endpoint_directory = {}
         self.endpoints = []
         self.tool_delimiter = tool_delimiter
         self.canvas = None
         self.reference_provider = None
-        self.dspy_tools = []
+        self._dspy_tools = None
+        # Bumped whenever endpoints or MCP tools change; get_tools/get_prompt
+        # results are memoized per version
+        self.catalog_version = 0
+        self._catalog_cache = (0, {})
+        self._catalog_lock = threading.Lock()
+        self._bridge = None
+        self._bridge_lock = threading.Lock()
+        self.bridge_workers = bridge_workers
+        self.max_concurrent_calls = max_concurrent_calls
+        self._semaphores = LoopLocal()
+        # Identical concurrent calls of idempotent tools share one request
+        if single_flight is True:
+            single_flight = SingleFlight()
+        self.single_flight = single_flight or None
         self.cl = None
         self.mcp = None
         self.app = app
 
-        if type(endpoints) == str:
-            with open(endpoints, "r") as file:
-                voitta_config = yaml.safe_load(file)
+        endpoints, parsed_settings = parse_config(endpoints)
+        settings = dict(settings or {}, **parsed_settings)
+
+        if "mcp_config" in settings:
+            mcp_config = settings["mcp_config"]
+
+        self.spec_cache, self.offline = resolve_spec_cache(spec_cache, offline, settings)
+
+        if http_options is None:
+            http_options = settings.get("http")
+        self.http_options = http_options or {}
+
+        if reference_store is None:
+            reference_store = settings.get("reference_store")
+        if write_behind is None and isinstance(reference_store, dict):
+            write_behind = reference_store.get("write_behind")
+        self.reference_store = get_reference_store(reference_store)
 
-            # Extract MCP configuration if present in the YAML file
-            if "mcp_config" in voitta_config:
-                mcp_config = voitta_config.pop("mcp_config")
+        if response_cache is None:
+            response_cache = settings.get("response_cache")
+        self.response_cache = get_response_cache(response_cache)
 
-            endpoints = [(r, voitta_config[r]) for r in voitta_config]
+        # Results above the spool threshold are kept on disk and previewed
+        if result_spool is None:
+            result_spool = settings.get("result_spool")
+        self.result_spool = get_result_spool(result_spool)
 
-        if type(endpoints) != list:
-            raise ValueError(
-                "Error parsing endpoints, either a yaml file or a valid list needed")
+        # Record arrays returned inline are rendered as compact tables
+        if result_tables is None:
+            result_tables = settings.get("result_tables")
+        self.result_tables = get_result_tables(result_tables)
+
+        # Ranking used by get_tools(query=...); the index itself is built on first use
+        if tool_index is None:
+            tool_index = settings.get("tool_index")
+        self.tool_index_options = get_tool_index_options(tool_index)
+
+        # Tool definitions can be shrunk to a token budget before they are sent
+        if compact_tools is None:
+            compact_tools = settings.get("compact_tools")
+        self.schema_compactor = get_schema_compactor(compact_tools)
+
+        # Endpoint tool name prefixes: "position" (1, 2, ... in config order) or
+        # "name" (independent of config order, so the catalog stays byte-stable)
+        if endpoint_ids is None:
+            endpoint_ids = settings.get("endpoint_ids", "position")
+        if endpoint_ids not in ("position", "name"):
+            raise ValueError(f"Unknown endpoint_ids setting: {endpoint_ids}")
+        self.endpoint_ids = endpoint_ids
 
         # Initialize MCP if config is provided
-        if mcp_config:
+        if isinstance(mcp_config, MCPServerDescription):
+            self.mcp = mcp_config
+        elif mcp_config:
             config_type = mcp_config.get("type", "cline")
             config_path = mcp_config.get("path")
             if config_path:
@@ -334,16 +922,30 @@ class VoittaRouter:
                 # Note: We don't await discover_all_tools here because __init__ can't be async
                 # The tools will be discovered when get_tools or get_prompt is called
 
+        self.config_fingerprint = config_fingerprint(endpoints, self.mcp, tool_delimiter)
+
         for name, info in endpoints:
             url = info["url"]
             if url == "canvas":
                 self.canvas = CanvasDescription()
+            elif prefetched is not None:
+                # Endpoints were built concurrently by VoittaRouter.create;
+                # the ones that failed or missed the deadline are skipped
+                if name not in prefetched:
+                    continue
+                endpoint = prefetched[name]
+                endpoint.response_cache = self.response_cache
+                self.endpoints.append(endpoint)
+                self.endpoint_directory[name] = endpoint
             else:
                 try:
                     endpoint = EndpointDescription(
                         name=name,
                         description=info.get("description", url),
-                        url=url, info=info, app=self.app)
+                        url=url, info=info, app=self.app,
+                        spec_cache=self.spec_cache, offline=self.offline,
+                        http_options=self.http_options,
+                        response_cache=self.response_cache)
                     self.endpoints.append(endpoint)
                     self.endpoint_directory[name] = endpoint
                 except Exception as e:
@@ -356,116 +958,446 @@ class VoittaRouter:
             if info.get("role", None) == "reference_provider":
                 self.reference_provider = endpoint
 
-        type_map = {
-            "boolean": "bool",
-            "string": "str",
-            "integer": "int"
-        }
+        if self.reference_store is None and self.reference_provider is not None:
+            self.reference_store = HTTPReferenceStore(self.reference_provider)
+
+        # Optionally take reference writes off the critical path of tool calls
+        self.write_behind = write_behind
+        if self.reference_store is not None and write_behind:
+            self.reference_store = WriteBehindReferenceStore(
+                self.reference_store, **(write_behind if isinstance(write_behind, dict) else {}))
 
-        for j, endpoint in enumerate(self.endpoints + ([self.canvas] if self.canvas else [])):
+        self.catalog_changed()
+
+        voitta_log(f"{len(self.endpoints)} endpoint(s) created")
+
+    @property
+    def bridge(self):
+        """Background event loop(s) that synchronous tool wrappers submit calls to"""
+        if self._bridge is None:
+            with self._bridge_lock:
+                if self._bridge is None:
+                    self._bridge = LoopBridge(workers=self.bridge_workers)
+        return self._bridge
+
+    async def flush_references(self, loops=None):
+        """Wait for reference writes queued in write-behind mode (on `loops`, default all)"""
+        if isinstance(self.reference_store, WriteBehindReferenceStore):
+            await self.reference_store.flush(loops)
+
+    def close(self, timeout=5):
+        """
+        Stop the background event loop(s) used by synchronous callers and delete spooled results.
+
+        Only writes queued on the background loops are flushed here; writes
+        queued on an application event loop need `await aclose()`
+        """
+        if self._bridge is not None:
+            if self._bridge.is_running() and not self._bridge.in_bridge_thread():
+                # Writes queued by synchronous tool calls live on the bridge loops.
+                # Draining the writers of another loop would block if that loop
+                # is the one calling close()
+                try:
+                    self._bridge.run(self.flush_references(self._bridge.loops()), timeout)
+                except concurrent.futures.TimeoutError:
+                    voitta_log(f"Reference writes not flushed within {timeout}s")
+            self._bridge.close()
+            self._bridge = None
+        if self.result_spool is not None:
+            self.result_spool.close()
+
+    async def aclose(self):
+        """Close pooled HTTP clients, stop MCP servers and the background loop(s)"""
+        # The reference store may still write through an endpoint, so it goes first
+        if self.reference_store is not None:
+            await self.reference_store.aclose()
+        for endpoint in self.endpoints:
+            await endpoint.aclose()
+        if self.mcp is not None:
+            await self.mcp.stop_all()
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    @property
+    def dspy_tools(self):
+        """Plain Python functions, one per tool, for dspy agents (built on first access)"""
+        if self._dspy_tools is None:
+            self._dspy_tools = self._build_dspy_tools()
+        return self._dspy_tools
+
+    @dspy_tools.setter
+    def dspy_tools(self, tools):
+        self._dspy_tools = tools
+
+    def _build_dspy_tools(self):
+        dspy_tools = []
+        prefixes = self.endpoint_prefixes() + ([("0", self.canvas)] if self.canvas else [])
+        for prefix, endpoint in prefixes:
             voitta_log(f" ===== DSP NAME: {endpoint.name} ==========")
             if endpoint.name in ["asset_manager", "google_agent"]:
                 voitta_log("\t skipping auth endpoints for now")
                 continue
-            if endpoint == self.canvas:
-                tools = endpoint.get_tools(str(0), self.tool_delimiter)
-            else:
-                tools = endpoint.get_tools(str(j+1), self.tool_delimiter)
+            tools = endpoint.get_tools(prefix, self.tool_delimiter)
             for tool in tools:
-                function_name = tool["function"]["name"]
-                function_desc = tool["function"]["description"]
-
-                p_short = []
-                p_long = []
-                p_arg = []
-                for parameter_name in tool["function"]["parameters"].get("properties", []):
-                    parameter_type = type_map[
-                        tool["function"]["parameters"]["properties"][parameter_name]["type"]
-                    ]
-                    parameter_desc =\
-                        tool["function"]["parameters"]["properties"][parameter_name]["description"]
-
-                    p_short.append(f"{parameter_name}: {parameter_type}")
-                    p_long.append(
-                        f"{parameter_name} ({parameter_type}): {parameter_desc}")
-                    p_arg.append(f'"{parameter_name}": {parameter_name}')
-
-                if len(p_short) == 0:
-                    func_text = f"def f_{function_name} () -> str:\n"
-                    func_text += f"\t'''{function_desc}'''\n\n"
-                else:
-                    func_text = f"def f_{function_name} ({','.join(p_short)}) -> str:\n"
-                    func_text += f"\t'''{function_desc}\n\n"
-                    func_text += "\tParameters:\n"
-                    func_text += "\t\t\n".join(p_long) + "'''\n\n"
-
-                func_text += f"""
-\tfrom asgiref.sync import async_to_sync
-\timport threading
-\timport uuid
-\timport sys
-\tresult = None
-\texception = None
-\tcall_id = str(uuid.uuid4())
-    
-    
-
-\tdef target():
-\t\tnonlocal result, exception, call_id
-\t\ttry:
-\t\t\t#cl = getattr(globals()[sys._getframe().f_code.co_name], 'cl')
-"""
-                if function_name[0] == "0":
-                    func_text += f"""\t\t\tresult = async_to_sync(this.call_function)('{function_name}',{{{','.join(p_arg)}}},cl,'',call_id)
-"""
-                else:
-                    func_text += f"""\t\t\tresult = async_to_sync(this.call_function)('{function_name}',{{{','.join(p_arg)}}},'','',call_id)
-"""
-                func_text += f"""\t\texcept Exception as e:
-\t\t\texception = e
-\tthread = threading.Thread(target=target)
-\tthread.start()
-\tthread.join()
-
-\tif exception:
-\t\t#voitta_log("***An exception occurred***:", exception)
-\t\traise exception
-
-\treturn result
-"""
+                try:
+                    dspy_tools.append(make_tool_function(self, tool))
+                except ValueError as e:
+                    voitta_log(f"Skipping dspy tool {tool['function']['name']}: {e}")
+        return dspy_tools
+
+    @classmethod
+    async def create(cls, endpoints, tool_delimiter="____", mcp_config=None, app=None,
+                     spec_cache=None, offline=False, timeout=5, deadline=30, **kwargs):
+        """
+        Build a router with all endpoint specs fetched concurrently.
+
+        Every endpoint is fetched and parsed in its own task on one shared
+        httpx.AsyncClient while MCP tool discovery runs alongside. An endpoint
+        that fails, or is not ready when `deadline` seconds have passed, is
+        skipped without holding up the others. Remaining keyword arguments are
+        passed on to the constructor.
+        """
+        endpoints, settings = parse_config(endpoints)
+        # Settings passed by the caller take precedence over the YAML sections
+        settings = dict(settings, **(kwargs.pop("settings", None) or {}))
+        if "mcp_config" in settings:
+            mcp_config = settings.pop("mcp_config")
+        spec_cache, offline = resolve_spec_cache(spec_cache, offline, settings)
+
+        http_options = kwargs.get("http_options")
+        if http_options is None:
+            http_options = settings.get("http") or {}
+
+        mcp = None
+        if isinstance(mcp_config, MCPServerDescription):
+            mcp = mcp_config
+        elif mcp_config and mcp_config.get("path"):
+            mcp = MCPServerDescription(mcp_config["path"], mcp_config.get("type", "cline"))
+
+        prefetched = {}
+
+        async def build_endpoint(client, name, info):
+            try:
+                spec = await afetch_spec(client, info["url"], timeout,
+                                         spec_cache=spec_cache, offline=offline)
+                prefetched[name] = EndpointDescription(
+                    name=name,
+                    description=info.get("description", info["url"]),
+                    url=info["url"], info=info, app=app,
+                    spec_cache=spec_cache, offline=offline, spec=spec,
+                    http_options=http_options)
+            except Exception as e:
+                voitta_log(
+                    f"==================  ERROR CREATING ENDPOINT {name}  =======================")
+                voitta_log(e)
+                traceback.print_exc()
 
-                namespace = {"this": self}
-                exec(func_text, namespace)
+        async def discover_mcp():
+            try:
+                await mcp.discover_all_tools()
+            except Exception as e:
+                voitta_log(f"Error during MCP tool discovery: {e}")
 
-                the_function = namespace[f"f_{function_name}"]
+        asgi_client = None
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            tasks = []
+            for name, info in endpoints:
+                if info["url"] == "canvas":
+                    continue
+                endpoint_client = client
+                if app is not None and info.get("type", "") == "web_client":
+                    # web_client endpoints are served in-process by `app`
+                    if asgi_client is None:
+                        asgi_client = httpx.AsyncClient(
+                            transport=httpx.ASGITransport(app=app), timeout=timeout)
+                    endpoint_client = asgi_client
+                tasks.append(asyncio.ensure_future(
+                    build_endpoint(endpoint_client, name, info)))
+            if mcp is not None:
+                tasks.append(asyncio.ensure_future(discover_mcp()))
+
+            if tasks:
+                done, pending = await asyncio.wait(tasks, timeout=deadline)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    voitta_log(f"{len(pending)} task(s) missed the {deadline}s deadline")
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+            if asgi_client is not None:
+                await asgi_client.aclose()
+
+        return cls(endpoints, tool_delimiter, mcp_config=mcp, app=app,
+                   spec_cache=spec_cache, offline=offline, prefetched=prefetched,
+                   settings=settings, **kwargs)
+
+    def save_snapshot(self, path):
+        """Write the tool catalog to `path` so it can be loaded with from_snapshot"""
+        snapshot = build_snapshot(self)
+        write_snapshot(snapshot, path)
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, path, config=None, app=None, strict=True, **kwargs):
+        """
+        Build a router from a catalog snapshot without any network access.
+
+        If `config` (a YAML path or endpoint list) is given, its fingerprint is
+        compared with the one recorded at compile time; a mismatch raises
+        ValueError, or is only logged when `strict` is False. The router
+        settings in `config` (reference_store, response_cache, compact_tools,
+        ...) are applied; the endpoint_ids scheme is the one the snapshot was
+        compiled with unless given as a keyword argument.
+        """
+        snapshot = read_snapshot(path)
+
+        settings = {}
+        if config is not None:
+            endpoints, settings = parse_config(config)
+            current = config_fingerprint(
+                endpoints, settings.get("mcp_config"), snapshot["tool_delimiter"])
+            if current != snapshot["config_fingerprint"]:
+                message = f"Snapshot {path} is stale: configuration has changed"
+                if strict:
+                    raise ValueError(message)
+                voitta_log(message)
+            # MCP tools come from the snapshot; servers start on first use
+            settings.pop("mcp_config", None)
+
+        kwargs.setdefault("endpoint_ids", snapshot.get("endpoint_ids", "position"))
+        kwargs["settings"] = dict(settings, **(kwargs.get("settings") or {}))
+        router = cls([], snapshot["tool_delimiter"], app=app, **kwargs)
+        router.config_fingerprint = snapshot["config_fingerprint"]
+        router.catalog_fingerprint = snapshot["catalog_fingerprint"]
+
+        for data in snapshot["endpoints"]:
+            endpoint = EndpointDescription.from_dict(
+                data, app=app, http_options=router.http_options,
+                response_cache=router.response_cache)
+            router.endpoints.append(endpoint)
+            router.endpoint_directory[endpoint.name] = endpoint
+
+        if snapshot["canvas"]:
+            router.canvas = CanvasDescription()
+
+        if snapshot["reference_provider"] is not None:
+            router.reference_provider = router.endpoint_directory.get(
+                snapshot["reference_provider"])
+            if router.reference_store is None and router.reference_provider is not None:
+                router.reference_store = HTTPReferenceStore(router.reference_provider)
+                if router.write_behind:
+                    router.reference_store = WriteBehindReferenceStore(
+                        router.reference_store,
+                        **(router.write_behind if isinstance(router.write_behind, dict) else {}))
+
+        if snapshot["mcp"] is not None:
+            router.mcp = MCPServerDescription(
+                snapshot["mcp"]["config_path"], snapshot["mcp"]["config_type"])
+            router.mcp.load_tools(snapshot["mcp"]["tools"])
+
+        router._dspy_tools = None
+        router.catalog_changed()
+
+        voitta_log(f"{len(router.endpoints)} endpoint(s) loaded from snapshot")
+        return router
+
+    def endpoint_prefixes(self):
+        """(tool name prefix, endpoint) pairs in catalog order"""
+        if self.endpoint_ids == "name":
+            return sorted(((stable_endpoint_id(endpoint.name, self.tool_delimiter), endpoint)
+                           for endpoint in self.endpoints), key=lambda pair: pair[0])
+        return [(str(j + 1), endpoint) for j, endpoint in enumerate(self.endpoints)]
+
+    def _catalog_signature(self):
+        """Cheap value that changes when endpoints, the canvas or MCP tools change"""
+        mcp_tools = self.mcp.tools if self.mcp is not None else None
+        return (len(self.endpoints), id(self.canvas), id(mcp_tools),
+                len(mcp_tools) if mcp_tools is not None else 0)
+
+    def _build_dispatch(self):
+        """
+        Build the name -> ToolRoute table for every exposed tool name, including
+        the shortened or hashed names of MCP tools, and swap it in
+        """
+        delimiter = self.tool_delimiter
+        table = {}
+        for prefix, endpoint in self.endpoint_prefixes():
+            for tool in endpoint.tools:
+                table[f"{prefix}{delimiter}{tool.operationId}"] = ToolRoute(
+                    "endpoint", endpoint, tool.operationId)
 
-                self.dspy_tools.append(the_function)
+        if self.canvas is not None:
+            prefix = f"0{delimiter}"
+            for tool in self.canvas.get_tools(0, delimiter):
+                name = tool["function"]["name"]
+                table[name] = ToolRoute("canvas", self.canvas, name[len(prefix):])
 
-        voitta_log(f"{len(self.endpoints)} endpoint(s) created")
+        if self.mcp is not None:
+            exposed = self.mcp.exposed_names("mcp", delimiter)
+            for tool, name in zip(self.mcp.tools, exposed):
+                route = ToolRoute("mcp", self.mcp, tool["name"])
+                table.setdefault(f"mcp{delimiter}{tool['name']}", route)
+                table[name] = route
+
+        self._dispatch_signature = self._catalog_signature()
+        # A single attribute assignment: concurrent callers see the old or the new table
+        self._dispatch = MappingProxyType(table)
+        return self._dispatch
+
+    def catalog_changed(self):
+        """
+        Drop memoized tool lists and prompts and rebuild the dispatch table.
+        Called after MCP discovery; call it after changing endpoints by hand.
+        """
+        with self._catalog_lock:
+            self.catalog_version += 1
+            self._build_dispatch()
+
+    def _check_catalog(self):
+        """Notice endpoints or MCP tools that were added or removed behind our back"""
+        if self._dispatch_signature != self._catalog_signature():
+            self.catalog_changed()
+
+    def _memoized(self, key, build):
+        """Value of build() for `key`, computed once per catalog version"""
+        self._check_catalog()
+        version, cache = self._catalog_cache
+        if version != self.catalog_version:
+            version, cache = self.catalog_version, {}
+            self._catalog_cache = (version, cache)
+        if key not in cache:
+            cache[key] = build()
+        return cache[key]
+
+    def _route(self, name):
+        """Look up where tool `name` is dispatched to"""
+        route = self._dispatch.get(name)
+        if route is None and self._dispatch_signature != self._catalog_signature():
+            self.catalog_changed()
+            route = self._dispatch.get(name)
+        if route is None:
+            # Unknown names take the old parsing path so they fail the same way
+            parts = name.split(self.tool_delimiter)
+            if parts[0] == "mcp":
+                return ToolRoute("mcp", self.mcp, parts[1])
+            if self.endpoint_ids == "name" and not parts[0].isdigit():
+                raise ValueError(f"Unknown tool: {name}")
+            endpoint_id = int(parts[0])
+            if endpoint_id == 0:
+                return ToolRoute("canvas", self.canvas, parts[1])
+            return ToolRoute("endpoint", self.endpoints[endpoint_id - 1], parts[1])
+        return route
 
     async def discover_mcp_tools(self):
         """Discover tools from MCP servers if MCP is initialized"""
+        if self.mcp is not None and self.mcp.tools_loaded:
+            # Tools came from a catalog snapshot
+            return
         if self.mcp is not None:
+            before = list(self.mcp.tools)
             try:
                 voitta_log("Starting MCP tool discovery...")
                 await self.mcp.discover_all_tools()
                 voitta_log("MCP tool discovery completed")
             except Exception as e:
                 voitta_log(f"Error during MCP tool discovery: {e}")
+            # Discovery runs before every get_tools_async; only a different
+            # tool list invalidates the memoized catalog
+            if self.mcp.tools != before:
+                self.catalog_changed()
+            else:
+                self._dispatch_signature = self._catalog_signature()
 
-    async def get_tools_async(self):
+    async def get_tools_async(self, query=None, top_k=None, pinned=None):
         """Async version of get_tools that ensures MCP tools are discovered first"""
         # Ensure MCP tools are discovered
         await self.discover_mcp_tools()
-        return self.get_tools()
+        return self.get_tools(query, top_k, pinned)
+
+    def get_tools(self, query=None, top_k=None, pinned=None):
+        """
+        Get all tools from OpenAPI endpoints, Canvas, and MCP.
+
+        With a `query` (e.g. the latest user message), only the pinned tools
+        and the `top_k` tools that the tool index ranks as most relevant are
+        returned; `top_k` and `pinned` (tool names or fnmatch patterns) default
+        to the `tool_index` settings.
+
+        With `compact_tools` set, the definitions are compacted (see
+        SchemaCompactor) to fit its token budget.
+
+        The tool dicts are built once per catalog version and shared between
+        calls; the returned list is a fresh copy, but do not modify the dicts.
+        """
+        if query is None:
+            return list(self._exposed_tools())
+        options = self.tool_index_options
+        tools = self.get_tool_index().select(
+            query,
+            top_k=options["top_k"] if top_k is None else top_k,
+            pinned=options["pinned"] if pinned is None else pinned)
+        if self.schema_compactor is not None:
+            tools = self.schema_compactor.compact(tools)
+        return tools
 
-    def get_tools(self):
-        """Get all tools from OpenAPI endpoints, Canvas, and MCP"""
+    def _exposed_tools(self):
+        """The full catalog as it is sent to the model"""
+        if self.schema_compactor is None:
+            return self._memoized("tools", self._build_tools)
+        return self._memoized("compact_tools", lambda: self.schema_compactor.compact(
+            self._memoized("tools", self._build_tools)))
+
+    def tool_token_report(self):
+        """
+        Estimated prompt tokens of every tool, as defined and after compaction
+        (with the default SchemaCompactor if `compact_tools` is not set), largest first
+        """
+        compactor = self.schema_compactor or SchemaCompactor()
+        return compactor.report(self._memoized("tools", self._build_tools))
+
+    def get_tool_index(self):
+        """ToolIndex over get_tools(), built once per catalog version"""
+        options = self.tool_index_options
+        return self._memoized("tool_index", lambda: ToolIndex(
+            self._memoized("tools", self._build_tools), method=options["method"],
+            dim=options["dim"], weight=options["weight"]))
+
+    def get_tools_json(self):
+        """
+        get_tools() as canonical JSON bytes, serialized once per catalog version.
+
+        The stdlib encoder is used (sorted keys, no whitespace) rather than the
+        configured JSON codec, so the bytes do not depend on which optional
+        JSON library a host has installed.
+        """
+        return self._memoized("tools_json", lambda: canonical_json(
+            self._exposed_tools()).encode("utf-8"))
+
+    def get_catalog_fingerprint(self, defult_prompt="These functions are available from the given API server:"):
+        """
+        SHA-256 of get_tools_json() and get_prompt(): equal fingerprints mean
+        byte-identical tool definitions and prompt, so a provider's prefix
+        prompt cache can be reused across processes and restarts
+        """
+        def build():
+            digest = hashlib.sha256(self.get_tools_json())
+            digest.update(b"\0")
+            digest.update(self.get_prompt(defult_prompt).encode("utf-8"))
+            return digest.hexdigest()
+
+        return self._memoized(("fingerprint", defult_prompt), build)
+
+    def _build_tools(self):
         tools = []
 
         # Add tools from OpenAPI endpoints
-        for j, endpoint in enumerate(self.endpoints):
-            tools += endpoint.get_tools(str(j+1), self.tool_delimiter)
+        for prefix, endpoint in self.endpoint_prefixes():
+            tools += endpoint.get_tools(prefix, self.tool_delimiter)
 
         # Add tools from Canvas
         if self.canvas is not None:
@@ -484,15 +1416,18 @@ class VoittaRouter:
         return self.get_prompt(defult_prompt)
 
     def get_prompt(self, defult_prompt="These functions are available from the given API server:"):
-        """Get prompt text describing all available tools"""
+        """Get prompt text describing all available tools (memoized per catalog version)"""
+        return self._memoized(("prompt", defult_prompt), lambda: self._build_prompt(defult_prompt))
+
+    def _build_prompt(self, defult_prompt):
         prompts = []
 
         # Add prompts from OpenAPI endpoints
-        for j, endpoint in enumerate(self.endpoints):
+        for prefix, endpoint in self.endpoint_prefixes():
             prompt = endpoint.prompt if endpoint.prompt else defult_prompt
             prompts.append(prompt)
             for tool in endpoint.tools:
-                prompts.append(f"{j+1}{self.tool_delimiter}{tool.operationId}")
+                prompts.append(f"{prefix}{self.tool_delimiter}{tool.operationId}")
             prompts.append("")
 
         prompt = "\n".join(prompts)
@@ -512,104 +1447,322 @@ class VoittaRouter:
 
     async def call_function(self, name, arguments, token, oauth_token, tool_call_id=""):
         """Call a function from an endpoint, canvas, or MCP server"""
-        parts = name.split(self.tool_delimiter)
+        content, _ = await self._call_function(
+            name, arguments, token, oauth_token, tool_call_id, memo={})
+        return content
+
+    async def _dereference_arguments(self, arguments, token, oauth_token, resolved=None, memo=None):
+        """
+        Replace `call_...` reference arguments, including ones nested in lists and
+        dicts, with the values stored under them.
+
+        Values already known in memory (`resolved`, e.g. results of earlier calls
+        in the same batch, and `memo`, values fetched earlier in the same request)
+        are used as is; all other references are fetched concurrently, and each
+        only once.
+        """
+        references = find_references(arguments)
+        if not references:
+            return arguments
+
+        known = {}
+        for source in (memo, resolved):
+            if source:
+                known.update({ref: source[ref] for ref in references if ref in source})
+
+        missing = [ref for ref in references if ref not in known]
+        if missing:
+            fetched = await self.reference_store.get_many(missing, token, oauth_token)
+            if memo is not None:
+                memo.update(fetched)
+            known.update(fetched)
+
+        return substitute_references(arguments, known)
+
+    async def _call_function(self, name, arguments, token, oauth_token, tool_call_id="",
+                             resolved=None, memo=None):
+        """
+        Implementation of call_function.
+
+        Returns:
+            A tuple of (content returned to the caller, value stored under
+            `tool_call_id` or None if nothing was stored)
+        """
+        route = self._route(name)
+
+        # Results of earlier calls in the same batch are known with or without a reference store
+        if resolved:
+            arguments = substitute_references(arguments, resolved)
 
         # Handle MCP calls
-        if parts[0] == "mcp":
+        if route.kind == "mcp":
             if self.mcp is None:
                 return json.dumps({
                     "status": "error",
                     "message": "MCP is not initialized"
-                })
+                }), None
 
-            # For MCP calls, the name is "mcp_server_X_tool"
-            mcp_name = parts[1]  # This is the server_X_tool part
-            result = await self.mcp.call_function(mcp_name, arguments, token, oauth_token)
-            return result
+            # For MCP calls, the function name is "server_X_tool"
+            result, spooled = await self._invoke(
+                name, self.mcp, route.function_name, arguments, token, oauth_token)
+            return self._postprocess(result, spooled), None
 
         # Handle OpenAPI and Canvas calls
-        endpoint_id = int(parts[0])
-        function_name = parts[1]
+        function_name = route.function_name
 
-        if endpoint_id == 0:
+        if route.kind == "canvas":
             endpoint = self.canvas
-            if self.reference_provider is not None:
-                new_arguments = {}
-                for argument in arguments:
-                    if bool(re.match(r"^call_[A-Za-z0-9]{24}$", arguments[argument])):
-                        new_value = await self.reference_provider.call_function("retrieve_value_api_retrieve_value_post",
-                                                                                {"key": arguments[argument]}, token, oauth_token)
-
-                        try:
-                            new_value = json.loads(new_value)["data"]
-                        except:
-                            pass
-                        new_arguments[argument] = new_value
-                    else:
-                        new_arguments[argument] = arguments[argument]
+            if self.reference_store is not None:
+                arguments = await self._dereference_arguments(
+                    arguments, token, oauth_token, resolved, memo)
 
-                result = await endpoint.call_function(function_name, new_arguments, token, oauth_token)
-            else:
-                result = await endpoint.call_function(function_name, arguments, token, oauth_token)
-
-            return result
+            result = await endpoint.call_function(function_name, arguments, token, oauth_token)
+            return result, None
         else:
-            endpoint = self.endpoints[endpoint_id - 1]
+            endpoint = route.target
 
             if endpoint == self.reference_provider:
                 result = await endpoint.call_function(function_name, arguments, token, oauth_token)
-                return result
+                return result, None
             else:
-                if self.reference_provider is not None:
+                if self.reference_store is not None:
                     # dereference arguments if nessesary
+                    arguments = await self._dereference_arguments(
+                        arguments, token, oauth_token, resolved, memo)
 
-                    new_arguments = {}
-                    for argument in arguments:
-                        if type(arguments[argument]) == str and\
-                                bool(re.match(r"^call_[A-Za-z0-9]{24}$", arguments[argument])):
-                            new_value = await self.reference_provider.call_function("retrieve_value_api_retrieve_value_post",
-                                                                                    {"key": arguments[argument]}, token, oauth_token)
-
-                            try:
-                                new_value = json.loads(new_value)["data"]
-                            except:
-                                pass
-
-                            new_arguments[argument] = new_value
-                        else:
-                            new_arguments[argument] = arguments[argument]
-
-                    result = await endpoint.call_function(function_name, new_arguments, token, oauth_token)
-
-                    """
-                    if type(result) == str:
-                        with open (f"{time.time()}.txt", "w") as f:
-                            f.write(result)
-                    else:
-                        with open (f"{time.time()}.bin", "wb") as f:
-                            f.write(result)
-                    """
+                    # A result stored by reference must be kept whole, not spooled
+                    result, spooled = await self._invoke(
+                        name, endpoint, function_name, arguments, token, oauth_token,
+                        spool=not tool_call_id)
 
                     try:
-                        result = json.loads(result)["data"]
+                        result = voitta_json.loads(result)["data"]
                     except:
                         voitta_log(">>>> ERROR JSONING RESULT >>>>>")
                         voitta_log(type(result))
-                        # voitta_log (result)
                         pass
 
                     # store the result to the tool call database
                     if tool_call_id:
-                        await self.reference_provider.call_function("store_value_api_store_value_post",
-                                                                    {"key": tool_call_id,
-                                                                        "value": result},
-                                                                    token, oauth_token)
-                        return f"reference: '{tool_call_id}'"
+                        await self.reference_store.put(tool_call_id, result, token, oauth_token)
+                        return f"reference: '{tool_call_id}'", result
                     else:
-                        return result
+                        return self._postprocess(result, spooled), None
                 else:
-                    result = await endpoint.call_function(function_name, arguments, token, oauth_token)
-                    return result
+                    result, spooled = await self._invoke(
+                        name, endpoint, function_name, arguments, token, oauth_token)
+                    return self._postprocess(result, spooled), None
+
+    async def stream_function(self, name, arguments, token, oauth_token,
+                              chunk_size=DEFAULT_CHUNK_SIZE, max_buffer=DEFAULT_MAX_BUFFER):
+        """
+        Call a function and yield its result incrementally instead of returning it.
+
+        OpenAPI tools yield the response body as bytes chunks of up to `chunk_size`;
+        at most `max_buffer` bytes that the caller has not consumed yet are held in
+        memory. MCP tools first yield their progress notifications as dicts, then
+        the result as bytes. `call_...` references in the arguments are resolved,
+        but the result is not stored as a reference.
+        """
+        route = self._route(name)
+
+        if route.kind == "mcp":
+            if self.mcp is None:
+                raise ValueError("MCP is not initialized")
+            async for chunk in self.mcp.stream_function(route.function_name, arguments, token,
+                                                        oauth_token, chunk_size=chunk_size):
+                yield chunk
+            return
+
+        if self.reference_store is not None and route.target != self.reference_provider:
+            arguments = await self._dereference_arguments(arguments, token, oauth_token, memo={})
+
+        if route.kind == "canvas":
+            result = await self.canvas.call_function(route.function_name, arguments, token, oauth_token)
+            yield result.encode("utf-8") if isinstance(result, str) else result
+            return
+
+        async for chunk in route.target.stream_function(route.function_name, arguments, token,
+                                                        oauth_token, chunk_size=chunk_size,
+                                                        max_buffer=max_buffer):
+            yield chunk
+
+    async def _invoke(self, name, target, function_name, arguments, token, oauth_token,
+                      spool=True):
+        """
+        Call `function_name` on an endpoint or the MCP servers; identical concurrent
+        calls of idempotent tools are coalesced into one request.
+
+        Returns:
+            A tuple of (result, True if the result was spooled and is a preview)
+        """
+        if self.single_flight is None or not target.is_idempotent(function_name):
+            return await self._fetch(target, function_name, arguments, token, oauth_token, spool)
+
+        # Callers that need the whole result must not share a spooled preview
+        key = make_key(name, arguments, token, oauth_token) + (spool,)
+        return await self.single_flight.do(
+            key, lambda: self._fetch(target, function_name, arguments, token, oauth_token, spool))
+
+    async def _fetch(self, target, function_name, arguments, token, oauth_token, spool=True):
+        """
+        One call of `function_name`. With a result spool (and no table rendering,
+        which needs the whole result), HTTP bodies are streamed to disk instead of
+        being read into memory, except for tools served from the response cache
+        and when `spool` is False.
+        """
+        result_spool = self.result_spool
+        if (spool and result_spool is not None and self.result_tables is None
+                and isinstance(target, EndpointDescription) and not target.is_cached(function_name)):
+            tool, headers, request = target._prepare_call(function_name, arguments, token, oauth_token)
+            # Methods without a request (e.g. DELETE) get call_function's answer
+            if request is not None:
+                result = await result_spool.collect(target.stream_request(request))
+                return result, result_spool.is_preview(result)
+
+        return await target.call_function(function_name, arguments, token, oauth_token), False
+
+    def _postprocess(self, result, spooled=False):
+        """Render record arrays as tables, then spool what is still too large"""
+        if spooled:
+            return result
+        if self.result_tables is not None:
+            result = self.result_tables.render_result(result)
+        if self.result_spool is not None:
+            result = self.result_spool.offload(result)
+        return result
+
+    def read_result(self, handle, offset=0, length=DEFAULT_PAGE_BYTES):
+        """
+        Page through a result that was spooled to disk.
+
+        Returns:
+            A dict with `data` (text), `offset`, `length`, the total `size` and
+            `next_offset` (None at the end)
+        """
+        if self.result_spool is None:
+            raise ValueError("No result spool configured")
+        return self.result_spool.read(handle, offset, length)
+
+    def read_table(self, handle, offset=0, limit=None, columns=None, format=None):
+        """
+        Render another page of a table returned in place of a record array,
+        starting at row `offset`, optionally projected to `columns`
+        """
+        if self.result_tables is None:
+            raise ValueError("Table rendering is not enabled")
+        return self.result_tables.read(handle, offset, limit, columns, format)
+
+    def _call_semaphore(self):
+        """Router-wide cap on concurrently running batch calls (one semaphore per loop)"""
+        if not self.max_concurrent_calls:
+            return None
+        return self._semaphores.get(lambda: asyncio.Semaphore(self.max_concurrent_calls))
+
+    async def call_functions(self, batch, token, oauth_token, deadline=None):
+        """
+        Run a batch of tool calls concurrently.
+
+        Calls whose arguments reference the tool_call_id of another call in the
+        batch (`call_...` values) wait for that call and receive its result in
+        memory instead of through the reference provider; independent calls
+        start immediately. Calls that are part of a reference cycle, or whose
+        upstream call failed, get an error envelope.
+
+        Args:
+            batch: List of (name, arguments, tool_call_id) tuples or dicts with
+                those keys; arguments may be a dict or a JSON string
+            deadline: Overall time limit in seconds for the whole batch
+
+        Returns:
+            One envelope per call, in the order of `batch`:
+            {"tool_call_id", "name", "status": "ok", "content"} or
+            {"tool_call_id", "name", "status": "error", "message"}
+        """
+        # A malformed entry (e.g. arguments that are not valid JSON) only fails itself
+        calls = []
+        invalid = {}
+        for i, call in enumerate(batch):
+            try:
+                calls.append(normalize_tool_call(call))
+            except Exception as e:
+                name, tool_call_id = tool_call_identity(call)
+                invalid[i] = f"Invalid tool call: {type(e).__name__}: {e}"
+                calls.append((name, {}, tool_call_id))
+        if not calls:
+            return []
+
+        semaphore = self._call_semaphore()
+        loop = asyncio.get_running_loop()
+        memo = {}
+
+        # Build the dependency graph between calls of this batch
+        producers = {}
+        for i, (name, arguments, tool_call_id) in enumerate(calls):
+            if tool_call_id and tool_call_id not in producers:
+                producers[tool_call_id] = i
+        dependencies = [
+            sorted({producers[ref] for ref in find_references(arguments)
+                    if ref in producers and producers[ref] != i})
+            for i, (name, arguments, tool_call_id) in enumerate(calls)
+        ]
+        in_cycle = find_cycles(dependencies)
+
+        # outcome[i] resolves to (True, value) or (False, error message)
+        outcome = [loop.create_future() for _ in calls]
+
+        async def run(i, name, arguments, tool_call_id):
+            if i in invalid:
+                outcome[i].set_result((False, invalid[i]))
+                return tool_call_result(tool_call_id, name, error=invalid[i])
+
+            if i in in_cycle:
+                message = "Circular reference between tool calls"
+                outcome[i].set_result((False, message))
+                return tool_call_result(tool_call_id, name, error=message)
+
+            resolved = {}
+            for j in dependencies[i]:
+                ok, value = await outcome[j]
+                if not ok:
+                    message = f"Upstream call {calls[j][2]} failed: {value}"
+                    outcome[i].set_result((False, message))
+                    return tool_call_result(tool_call_id, name, error=message)
+                resolved[calls[j][2]] = value
+
+            try:
+                if semaphore is not None:
+                    async with semaphore:
+                        content, stored = await self._call_function(
+                            name, arguments, token, oauth_token, tool_call_id, resolved, memo)
+                else:
+                    content, stored = await self._call_function(
+                        name, arguments, token, oauth_token, tool_call_id, resolved, memo)
+            except Exception as e:
+                voitta_log(f"Tool call {name} failed: {e}")
+                message = f"{type(e).__name__}: {e}"
+                outcome[i].set_result((False, message))
+                return tool_call_result(tool_call_id, name, error=message)
+
+            outcome[i].set_result((True, content if stored is None else stored))
+            return tool_call_result(tool_call_id, name, content=content)
+
+        tasks = [asyncio.ensure_future(run(i, *call)) for i, call in enumerate(calls)]
+
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        results = []
+        for task, (name, arguments, tool_call_id) in zip(tasks, calls):
+            if task in done:
+                results.append(task.result())
+            else:
+                results.append(tool_call_result(
+                    tool_call_id, name, error=f"Timed out after {deadline}s"))
+        return results
 
     async def call_function_by_endpoint_name(self, endpoint_name, function_name, arguments, token, oauth_token):
         endpoint = self.endpoint_directory.get(endpoint_name)
@@ -0,0 +1,228 @@
+import collections
+import json
+import os
+import hashlib
+import tempfile
+import threading
+import time
+
+def voitta_log(message):
+    return
+
+DEFAULT_CACHE_DIR = "~/.cache/voitta/specs"
+
+
+def make_key(name, arguments, token=None, oauth_token=None):
+    """Key of a call: tool name, canonical arguments and a hash of the credentials"""
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    scope = hashlib.sha256(f"{token}\n{oauth_token}".encode("utf-8")).hexdigest()[:16]
+    return (name, canonical, scope)
+
+
+class SpecCache:
+    """
+    On-disk cache of OpenAPI documents (and `__prompt__` text) keyed by endpoint URL.
+
+    Each entry keeps the validators (ETag / Last-Modified) returned by the server
+    so that the next fetch can be a conditional request.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.environ.get("VOITTA_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.path = os.path.expanduser(path)
+
+    def _file(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, url):
+        """Return the cached entry for `url` or None"""
+        try:
+            with open(self._file(url), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    def put(self, url, openapi, prompt=None, headers=None):
+        """Store a freshly downloaded spec together with its validators"""
+        headers = headers or {}
+        entry = {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time(),
+            "openapi": openapi,
+            "prompt": prompt
+        }
+
+        os.makedirs(self.path, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see
+        # a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._file(url))
+        except Exception as e:
+            voitta_log(f"Failed to write spec cache for {url}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return entry
+
+    def remove(self, url):
+        try:
+            os.remove(self._file(url))
+        except OSError:
+            pass
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Request headers that let the server answer 304 Not Modified"""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+def get_spec_cache(spec_cache):
+    """Normalize the `spec_cache` router option (None/False, True, a path or a SpecCache)"""
+    if spec_cache is None or spec_cache is False:
+        return None
+    if spec_cache is True:
+        return SpecCache()
+    if isinstance(spec_cache, str):
+        return SpecCache(spec_cache)
+    if isinstance(spec_cache, dict):
+        return SpecCache(spec_cache.get("path"))
+    return spec_cache
+
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into {directive: value or True}"""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if "=" in part:
+            name, _, argument = part.partition("=")
+            directives[name.strip()] = argument.strip().strip('"')
+        else:
+            directives[part] = True
+    return directives
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of responses of idempotent (GET) tools.
+
+    Entries live for the TTL configured for the tool, capped by the server's
+    Cache-Control max-age; `no-store` responses are never cached. Expired
+    entries that carry an ETag are revalidated with If-None-Match.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, operation_id, arguments, token=None, oauth_token=None):
+        """Cache key from endpoint, operationId, canonical arguments and auth scope"""
+        return (url,) + make_key(operation_id, arguments, token, oauth_token)
+
+    def lookup(self, key):
+        """
+        Returns:
+            A tuple of (entry or None, fresh) where entry is a dict with
+            `text`, `etag` and `expires`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+        return entry, entry["expires"] > time.monotonic()
+
+    def store(self, key, text, ttl, headers=None):
+        """Cache a response unless its Cache-Control forbids it"""
+        headers = headers or {}
+        directives = parse_cache_control(headers.get("cache-control"))
+        if "no-store" in directives:
+            return None
+
+        if "no-cache" in directives:
+            ttl = 0
+        elif "max-age" in directives:
+            try:
+                ttl = min(ttl, int(directives["max-age"]))
+            except ValueError:
+                pass
+
+        etag = headers.get("etag")
+        if ttl <= 0 and etag is None:
+            return None
+
+        entry = {"text": text, "etag": etag, "expires": time.monotonic() + ttl, "ttl": ttl}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def refresh(self, entry, headers=None):
+        """Extend an entry after a 304 Not Modified answer"""
+        ttl = entry["ttl"]
+        directives = parse_cache_control((headers or {}).get("cache-control"))
+        if "max-age" in directives:
+            try:
+                ttl = int(directives["max-age"])
+            except ValueError:
+                pass
+        entry["expires"] = time.monotonic() + ttl
+        self.revalidations += 1
+
+    def invalidate(self, url=None):
+        """Drop all entries, or only those of one endpoint"""
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == url]:
+                    del self._entries[key]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "entries": len(self._entries)
+        }
+
+
+def get_response_cache(response_cache):
+    """Normalize the `response_cache` router option (None/False, True, a dict or a ResponseCache)"""
+    if response_cache is None or response_cache is False:
+        return None
+    if response_cache is True:
+        return ResponseCache()
+    if isinstance(response_cache, dict):
+        return ResponseCache(max_entries=response_cache.get("max_entries", 1024),
+                             default_ttl=response_cache.get("default_ttl", 0))
+    return response_cache
@@ -0,0 +1,194 @@
+import re
+
+from . import voitta_json
+from .voitta_index import tokenize
+from .voitta_tables import estimate_tokens
+
+def voitta_log(message):
+    return
+
+# Description length limits (characters) for the tool and for each parameter,
+# tried in order until the catalog fits the token budget; None means no limit
+LEVELS = [(None, None), (400, 120), (200, 60), (120, 40), (60, 0)]
+
+# Placeholder descriptions generated when the source had none
+_placeholder_re = re.compile(
+    r"^(?:-+ NO DESCRIPTION PROVIDED -+|Parameter \S+|Tool from \S+)$", re.IGNORECASE)
+# Filler at the start of a description
+_boilerplate_re = re.compile(
+    r"^(?:This (?:endpoint|operation|tool|function|method|API|route)\s+(?:will\s+|is used to\s+|can be used to\s+|allows you to\s+)?"
+    r"|Use this (?:endpoint|tool|function) to\s+|Endpoint (?:to|for|that)\s+)", re.IGNORECASE)
+_sentence_re = re.compile(r"(?<=[.!?])\s+")
+_filler_words = {"the", "a", "an", "of", "for", "to", "this", "that", "parameter", "value",
+                 "field", "param", "argument", "given", "specified", "provided"}
+
+
+# Markdown *emphasis* or `code` not touching word characters; underscores are
+# left alone because they are far more common in identifiers (user_id, __init__)
+# than as emphasis markers
+_emphasis_re = re.compile(r"(?<!\w)(\*{1,3}|`)(?=\S)(.+?)(?<=\S)\1(?!\w)")
+
+
+def clean_text(text):
+    """Collapse whitespace and markdown emphasis"""
+    text = _emphasis_re.sub(r"\2", text)
+    return " ".join(text.split())
+
+
+def strip_boilerplate(sentence):
+    match = _boilerplate_re.match(sentence)
+    if match and len(sentence) > match.end():
+        return sentence[match.end()].upper() + sentence[match.end() + 1:]
+    return sentence
+
+
+def dedupe_sentences(text):
+    """`text` without filler openings and without sentences it already said"""
+    sentences = []
+    seen = set()
+    for sentence in _sentence_re.split(text):
+        sentence = strip_boilerplate(sentence)
+        if sentence and sentence.lower() not in seen:
+            seen.add(sentence.lower())
+            sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def shorten(text, limit):
+    """`text` cut to `limit` characters, at a sentence or word boundary if possible"""
+    if limit is None or len(text) <= limit:
+        return text
+    if limit <= 0:
+        return ""
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    if end >= limit // 2:
+        return cut[:end + 1]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > 0 else cut).rstrip(",;:") + "…"
+
+
+def compact_description(text, limit=None):
+    if not isinstance(text, str):
+        return ""
+    text = clean_text(text)
+    if _placeholder_re.match(text):
+        return ""
+    return shorten(dedupe_sentences(text), limit)
+
+
+def _redundant(name, description, seen):
+    """True if a parameter description adds nothing to its name or repeats another one"""
+    if not description or description in seen:
+        return True
+    words = set(tokenize(description)) - _filler_words
+    return words <= set(tokenize(name))
+
+
+def compact_schema(schema, limit, seen):
+    """Copy of a parameter schema with compacted descriptions and without defaults that say nothing"""
+    if not isinstance(schema, dict):
+        return schema
+    result = {}
+    for key, value in schema.items():
+        if key == "properties" and isinstance(value, dict):
+            result[key] = {}
+            for name, prop in value.items():
+                prop = compact_schema(prop, limit, seen)
+                if isinstance(prop, dict) and "description" in prop:
+                    description = compact_description(prop["description"], limit)
+                    if _redundant(name, description, seen):
+                        del prop["description"]
+                    else:
+                        prop["description"] = description
+                        seen.add(description)
+                result[key][name] = prop
+        elif key == "items":
+            result[key] = compact_schema(value, limit, seen)
+        elif key == "title":
+            # Titles are generated from the property name and repeat it
+            continue
+        elif key in ("default", "examples") and value in (None, "", [], {}):
+            continue
+        else:
+            result[key] = value
+    if result.get("required") == []:
+        del result["required"]
+    return result
+
+
+def compact_tool(tool, tool_limit=None, param_limit=None):
+    """Compacted copy of an OpenAI function dict; the original is left unchanged"""
+    function = tool["function"]
+    result = {key: value for key, value in function.items()
+              if key not in ("description", "parameters", "strict")}
+    if function.get("strict"):
+        result["strict"] = True
+    description = compact_description(function.get("description"), tool_limit)
+    if description:
+        result["description"] = description
+    if "parameters" in function:
+        seen = {description} if description else set()
+        result["parameters"] = compact_schema(function["parameters"], param_limit, seen)
+    return {**tool, "function": result}
+
+
+def tool_tokens(tool):
+    """Estimated number of prompt tokens of one tool definition"""
+    return estimate_tokens(voitta_json.dumps(tool))
+
+
+class SchemaCompactor:
+    """
+    Shrinks tool definitions before they are sent to the model.
+
+    Descriptions are cleaned up (whitespace, markdown, repeated sentences,
+    placeholders like "Parameter x", filler such as "This endpoint will ..."),
+    parameter descriptions that only restate the parameter name or another
+    description are dropped, and so are `strict: false`, empty `required`
+    lists and empty defaults. If the catalog is still larger than `max_tokens`,
+    descriptions are cut to shorter and shorter lengths (see LEVELS) until it fits.
+    """
+
+    def __init__(self, max_tokens=None, levels=LEVELS):
+        self.max_tokens = max_tokens
+        self.levels = levels
+
+    def compact(self, tools):
+        """Compacted copies of `tools` within the budget (or as small as the levels allow)"""
+        for tool_limit, param_limit in self.levels:
+            compacted = [compact_tool(tool, tool_limit, param_limit) for tool in tools]
+            if self.max_tokens is None:
+                return compacted
+            total = sum(tool_tokens(tool) for tool in compacted)
+            if total <= self.max_tokens:
+                break
+        voitta_log(f"Compacted {len(tools)} tools to ~{total} tokens "
+                   f"(levels {tool_limit}/{param_limit})")
+        return compacted
+
+    def report(self, tools):
+        """
+        Estimated token cost of every tool before and after compaction, largest first:
+        a list of {"name", "tokens", "compact_tokens"} dicts
+        """
+        compacted = self.compact(tools)
+        rows = [{"name": tool["function"]["name"],
+                 "tokens": tool_tokens(tool),
+                 "compact_tokens": tool_tokens(small)}
+                for tool, small in zip(tools, compacted)]
+        return sorted(rows, key=lambda row: row["compact_tokens"], reverse=True)
+
+
+def get_schema_compactor(compact_tools):
+    """
+    Normalize the `compact_tools` router option: None/False, True (lossless
+    cleanup only), a dict such as {"max_tokens": 8000}, or a SchemaCompactor
+    """
+    if compact_tools is None or compact_tools is False:
+        return None
+    if compact_tools is True:
+        return SchemaCompactor()
+    if isinstance(compact_tools, dict):
+        return SchemaCompactor(max_tokens=compact_tools.get("max_tokens"))
+    return compact_tools
@@ -0,0 +1,188 @@
+import collections
+import fnmatch
+import math
+import re
+import zlib
+
+def voitta_log(message):
+    return
+
+METHODS = ["bm25", "embedding", "hybrid"]
+DEFAULT_TOP_K = 20
+DEFAULT_DIM = 512
+DEFAULT_WEIGHT = 0.5
+
+_word_re = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text):
+    """Lowercase words of `text`; camelCase and snake_case names are split into parts"""
+    return [word.lower() for word in _word_re.findall(text or "")]
+
+
+def tool_text(tool):
+    """
+    Searchable text of a tool (an OpenAI function dict as returned by get_tools):
+    its name, description, and the names and descriptions of its parameters
+    """
+    function = tool.get("function", tool)
+    parts = [function.get("name", ""), function.get("description", "")]
+
+    def walk(schema):
+        if not isinstance(schema, dict):
+            return
+        for name, prop in (schema.get("properties") or {}).items():
+            parts.append(name)
+            if isinstance(prop, dict):
+                parts.append(prop.get("description", ""))
+                walk(prop)
+        walk(schema.get("items"))
+
+    walk(function.get("parameters"))
+    return " ".join(part for part in parts if isinstance(part, str))
+
+
+def _features(tokens):
+    """Words and character trigrams of words, for the hashed embedding"""
+    features = list(tokens)
+    for token in tokens:
+        padded = f"<{token}>"
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return features
+
+
+class ToolIndex:
+    """
+    Local retrieval index over a tool list, to send only the tools that are
+    relevant to the current request.
+
+    Tools are scored against a query with BM25 over the words of their name,
+    description and parameter docs ("bm25"), with the cosine similarity of
+    hashed bag-of-words/trigram embeddings ("embedding", robust to partial
+    words), or with a weighted mix of both ("hybrid"). NumPy is imported when
+    the index is built.
+    """
+
+    def __init__(self, tools, method="hybrid", dim=DEFAULT_DIM, weight=DEFAULT_WEIGHT,
+                 k1=1.5, b=0.75):
+        import numpy as np
+
+        if method not in METHODS:
+            raise ValueError(f"Unknown tool index method: {method}")
+        self.tools = list(tools)
+        self.names = [tool.get("function", tool).get("name") for tool in self.tools]
+        self.method = method
+        self.dim = dim
+        self.weight = weight
+        self._pinned = {}
+        docs = [tokenize(tool_text(tool)) for tool in self.tools]
+
+        if method != "embedding":
+            self._build_bm25(np, docs, k1, b)
+        if method != "bm25":
+            self._vectors = np.zeros((len(docs), dim), dtype=np.float32)
+            for i, doc in enumerate(docs):
+                self._vectors[i] = self._embed(np, doc)
+        voitta_log(f"Tool index: {len(self.tools)} tools, method {method}")
+
+    def _build_bm25(self, np, docs, k1, b):
+        """Inverted index with the BM25 weight of every (term, tool) pair precomputed"""
+        lengths = np.array([len(doc) for doc in docs], dtype=np.float32)
+        average = float(lengths.mean()) if len(docs) and lengths.mean() > 0 else 1.0
+        postings = collections.defaultdict(lambda: ([], []))
+        for i, doc in enumerate(docs):
+            for term, tf in collections.Counter(doc).items():
+                ids, tfs = postings[term]
+                ids.append(i)
+                tfs.append(tf)
+
+        n = len(docs)
+        self._postings = {}
+        for term, (ids, tfs) in postings.items():
+            ids = np.array(ids, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = k1 * (1 - b + b * lengths[ids] / average)
+            self._postings[term] = (ids, (idf * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32))
+
+    def _embed(self, np, tokens):
+        """L2-normalized signed feature hashing of words and trigrams"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in collections.Counter(_features(tokens)).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += (1.0 if h & 0x80000000 else -1.0) * (1 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def scores(self, query):
+        """Relevance of every tool to `query`, as a NumPy array in tool order"""
+        import numpy as np
+
+        tokens = tokenize(query)
+        total = np.zeros(len(self.tools), dtype=np.float32)
+        if self.method != "embedding":
+            for term in set(tokens):
+                if term in self._postings:
+                    ids, weights = self._postings[term]
+                    total[ids] += weights
+            if self.method == "bm25":
+                return total
+            # Bring BM25 into the same 0..1 range as the cosine similarity
+            top = total.max() if len(total) else 0
+            if top > 0:
+                total /= top
+            total *= self.weight
+        similarity = self._vectors @ self._embed(np, tokens)
+        if self.method == "embedding":
+            return similarity
+        return total + (1 - self.weight) * similarity
+
+    def search(self, query, top_k=DEFAULT_TOP_K, exclude=()):
+        """Indices of the `top_k` tools most relevant to `query`, best first"""
+        import numpy as np
+
+        scores = self.scores(query)
+        if exclude:
+            scores[list(exclude)] = -np.inf
+            top_k = min(top_k, len(scores) - len(set(exclude)))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")].tolist()
+
+    def pinned_indices(self, pinned):
+        """Indices (in tool order) of tools whose names match any of the `pinned` patterns"""
+        if not pinned:
+            return []
+        key = tuple(pinned)
+        # Matching every name is far slower than ranking; do it once per pattern list
+        if key not in self._pinned:
+            self._pinned[key] = [i for i, name in enumerate(self.names)
+                                 if any(fnmatch.fnmatchcase(name, pattern) for pattern in key)]
+        return self._pinned[key]
+
+    def select(self, query, top_k=DEFAULT_TOP_K, pinned=()):
+        """
+        Tools for `query`: the pinned tools (names or fnmatch patterns) first,
+        then the `top_k` best-ranked of the others
+        """
+        pinned = self.pinned_indices(pinned)
+        ranked = self.search(query, top_k, exclude=pinned)
+        return [self.tools[i] for i in pinned + ranked]
+
+
+def get_tool_index_options(tool_index):
+    """
+    Normalize the `tool_index` router option: None or a dict such as
+    {"method": "hybrid", "top_k": 20, "pinned": ["0____*"], "dim": 512, "weight": 0.5}
+    """
+    options = {"method": "hybrid", "top_k": DEFAULT_TOP_K, "pinned": [],
+               "dim": DEFAULT_DIM, "weight": DEFAULT_WEIGHT}
+    options.update(tool_index or {})
+    if options["method"] not in METHODS:
+        raise ValueError(f"Unknown tool index method: {options['method']}")
+    return options
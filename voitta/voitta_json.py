@@ -0,0 +1,166 @@
+import json
+import os
+import warnings
+from typing import Dict
+
+def voitta_log(message):
+    return
+
+# Preferred order when the backend is "auto"
+BACKENDS = ["orjson", "msgspec", "json"]
+
+
+class RawJSON(str):
+    """Text that is known to be valid JSON and is forwarded without re-encoding"""
+
+
+def _stdlib_dumps(value, sort_keys=False):
+    return json.dumps(value, sort_keys=sort_keys, separators=(",", ":"),
+                      ensure_ascii=False, default=str)
+
+
+class JSONCodec:
+    """
+    JSON encoding and decoding with the fastest available library.
+
+    `backend` is "orjson", "msgspec", "json" or "auto" (the first one that can
+    be imported). All backends produce compact JSON, accept str or bytes and
+    raise ValueError on invalid input.
+
+    In `passthrough` mode (msgspec only), the `result` of JSON-RPC responses
+    from MCP servers is kept as RawJSON and forwarded as it is instead of being
+    parsed and serialized again. Plain str values are always validated. "auto"
+    then prefers msgspec; another explicit backend is rejected.
+    """
+
+    def __init__(self, backend="auto", passthrough=False):
+        if passthrough and backend not in ("auto", "msgspec"):
+            raise ValueError(f"JSON passthrough needs the msgspec backend, not {backend}")
+        self.passthrough = passthrough
+        self._raw = None
+        candidates = BACKENDS
+        if passthrough:
+            candidates = ["msgspec"] + [name for name in BACKENDS if name != "msgspec"]
+        for name in (candidates if backend == "auto" else [backend]):
+            try:
+                self._setup(name)
+                break
+            except ImportError:
+                if backend != "auto":
+                    raise
+        if passthrough and self._raw is None:
+            warnings.warn("JSON passthrough is disabled because msgspec is not installed")
+        voitta_log(f"JSON backend: {self.backend}")
+
+    def _setup(self, name):
+        if name == "orjson":
+            import orjson
+
+            def dumps_bytes(value, sort_keys=False):
+                options = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+                return orjson.dumps(value, default=str, option=options)
+
+            self._loads = orjson.loads
+            self.dumps_bytes = dumps_bytes
+        elif name == "msgspec":
+            import msgspec
+
+            encoder = msgspec.json.Encoder(enc_hook=str)
+            sorted_encoder = msgspec.json.Encoder(enc_hook=str, order="sorted")
+            decoder = msgspec.json.Decoder()
+            raw_decoder = msgspec.json.Decoder(type=Dict[str, msgspec.Raw])
+
+            # msgspec errors are not ValueErrors; raise the same error type as the other backends
+            def loads(data):
+                try:
+                    return decoder.decode(data)
+                except msgspec.DecodeError as e:
+                    raise ValueError(str(e)) from None
+
+            def raw_fields(data):
+                try:
+                    return raw_decoder.decode(data)
+                except msgspec.DecodeError as e:
+                    raise ValueError(str(e)) from None
+
+            def dumps_bytes(value, sort_keys=False):
+                return (sorted_encoder if sort_keys else encoder).encode(value)
+
+            self._loads = loads
+            self._raw = raw_fields
+            self.dumps_bytes = dumps_bytes
+        elif name == "json":
+            self._loads = json.loads
+            self.dumps_bytes = lambda value, sort_keys=False: _stdlib_dumps(
+                value, sort_keys).encode("utf-8")
+        else:
+            raise ValueError(f"Unknown JSON backend: {name}")
+        self.backend = name
+
+    def loads(self, data):
+        if type(data) is RawJSON:
+            # The C decoders only accept exact str (or bytes)
+            data = str.__str__(data)
+        return self._loads(data)
+
+    def dumps(self, value, sort_keys=False):
+        """Serialize `value` to a str; RawJSON is returned unchanged"""
+        if isinstance(value, RawJSON):
+            return value
+        return self.dumps_bytes(value, sort_keys).decode("utf-8")
+
+    def is_json(self, text):
+        """True if `text` is valid JSON; RawJSON was checked by the decoder and is not parsed again"""
+        if isinstance(text, RawJSON):
+            return True
+        try:
+            self.loads(text)
+            return True
+        except ValueError:
+            return False
+
+    def loads_message(self, data):
+        """
+        Decode a JSON-RPC message. In passthrough mode (msgspec only) `result` is
+        left undecoded and returned as RawJSON.
+        """
+        if not self.passthrough or self._raw is None:
+            return self.loads(data)
+        fields = self._raw(data)
+        message = {key: self._loads(raw) for key, raw in fields.items() if key != "result"}
+        if "result" in fields:
+            message["result"] = RawJSON(bytes(fields["result"]).decode("utf-8"))
+        return message
+
+
+# Chosen with VOITTA_JSON (auto, orjson, msgspec, json) and VOITTA_JSON_PASSTHROUGH=1,
+# or later with configure()
+codec = JSONCodec(os.environ.get("VOITTA_JSON", "auto"),
+                  passthrough=os.environ.get("VOITTA_JSON_PASSTHROUGH", "") not in ("", "0", "false"))
+
+
+def configure(backend="auto", passthrough=False):
+    """Replace the codec used by all Voitta modules"""
+    global codec
+    codec = JSONCodec(backend, passthrough)
+    return codec
+
+
+def loads(data):
+    return codec.loads(data)
+
+
+def dumps(value, sort_keys=False):
+    return codec.dumps(value, sort_keys)
+
+
+def dumps_bytes(value, sort_keys=False):
+    return codec.dumps_bytes(value, sort_keys)
+
+
+def is_json(text):
+    return codec.is_json(text)
+
+
+def loads_message(data):
+    return codec.loads_message(data)
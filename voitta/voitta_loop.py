@@ -0,0 +1,131 @@
+import asyncio
+import itertools
+import threading
+import weakref
+
+def voitta_log(message):
+    return
+
+
+class LoopBridge:
+    """
+    Long-lived background event loops that synchronous code can submit coroutines to.
+
+    Each worker is a daemon thread running its own event loop forever; submitted
+    coroutines are spread over the workers round-robin. Because the loops outlive
+    individual calls, loop-bound resources such as connection pools are reused.
+    """
+
+    def __init__(self, workers=1, name="voitta-loop"):
+        if workers < 1:
+            raise ValueError("LoopBridge needs at least one worker")
+        self.workers = workers
+        self.name = name
+        self._loops = []
+        self._threads = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (called automatically on first submit)"""
+        with self._lock:
+            if self._loops:
+                return
+            for i in range(self.workers):
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                thread = threading.Thread(
+                    target=self._run_loop, args=(loop, ready),
+                    name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                ready.wait()
+                self._loops.append(loop)
+                self._threads.append(thread)
+            voitta_log(f"LoopBridge started with {self.workers} worker(s)")
+
+    @staticmethod
+    def _run_loop(loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+
+    def is_running(self):
+        return bool(self._loops)
+
+    def loops(self):
+        """The running worker loops"""
+        return list(self._loops)
+
+    def in_bridge_thread(self):
+        return threading.current_thread() in self._threads
+
+    def submit(self, coroutine):
+        """Schedule `coroutine` on one of the loops and return a concurrent.futures.Future"""
+        if not self._loops:
+            self.start()
+        loop = self._loops[next(self._counter) % len(self._loops)]
+        return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    def run(self, coroutine, timeout=None):
+        """Run `coroutine` on a background loop and block until it returns"""
+        if self.in_bridge_thread():
+            coroutine.close()
+            raise RuntimeError(
+                "LoopBridge.run() called from a bridge loop; await the coroutine instead")
+        return self.submit(coroutine).result(timeout)
+
+    def close(self, timeout=5):
+        """Stop all loops and wait for the worker threads to exit"""
+        with self._lock:
+            loops, threads = self._loops, self._threads
+            self._loops, self._threads = [], []
+
+        for loop in loops:
+            loop.call_soon_threadsafe(loop.stop)
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+
+class LoopLocal:
+    """
+    Per-event-loop storage for loop-bound objects such as httpx clients.
+
+    asyncio primitives and connection pools must not be shared between event
+    loops; callers on the bridge loops and on an application loop each get
+    their own instance, created on first use.
+    """
+
+    def __init__(self):
+        self._values = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, factory):
+        loop = asyncio.get_running_loop()
+        value = self._values.get(loop)
+        if value is None:
+            with self._lock:
+                value = self._values.get(loop)
+                if value is None:
+                    value = factory()
+                    self._values[loop] = value
+        return value
+
+    def current(self):
+        """Value for the running loop, or None"""
+        return self._values.get(asyncio.get_running_loop())
+
+    def pop_all(self, loops=None):
+        """Remove and return all (loop, value) pairs, or only those of `loops`"""
+        with self._lock:
+            items = [(loop, value) for loop, value in self._values.items()
+                     if loops is None or loop in loops]
+            for loop, value in items:
+                del self._values[loop]
+        return items
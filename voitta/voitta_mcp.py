@@ -10,10 +10,20 @@ import importlib.util
 from typing import Dict, List, Any, Optional, Tuple
 import tempfile
 import uuid
+import collections
+import hashlib
+import re
+
+from . import voitta_json
+from .voitta_json import RawJSON
+from .voitta_stream import DEFAULT_CHUNK_SIZE
 
 def voitta_log(message):
     return
 
+# Progress notifications queued by stream_function before older ones are dropped
+DEFAULT_MAX_PROGRESS = 64
+
 class MCPProcess:
     """
     Class to manage an MCP server process using asyncio.subprocess.
@@ -26,6 +36,8 @@ class MCPProcess:
         self.process = None
         self.request_id_counter = 0
         self.pending_requests = {}
+        # progressToken -> callback for `notifications/progress` messages
+        self.progress_handlers = {}
         self.consecutive_timeouts = 0
         self._stdout_task = None
         self._stderr_task = None
@@ -128,19 +140,26 @@ class MCPProcess:
                             "Stdout closed unexpectedly while process is still running")
                     break
 
-                line_str = line.decode('utf-8').strip()
-                if not line_str:
+                line = line.strip()
+                if not line:
                     continue
 
                 try:
-                    voitta_log(f"Received from MCP: {line_str}")
-                    response = json.loads(line_str)
+                    voitta_log(f"Received {len(line)} bytes from MCP")
+                    response = voitta_json.loads_message(line)
 
                     # Validate that this is a proper JSON-RPC 2.0 response
                     if "jsonrpc" not in response or response["jsonrpc"] != "2.0":
                         voitta_log(
                             f"Warning: Response missing or invalid jsonrpc version: {response}")
 
+                    if response.get("method") == "notifications/progress":
+                        params = response.get("params", {})
+                        handler = self.progress_handlers.get(params.get("progressToken"))
+                        if handler is not None:
+                            handler(params)
+                        continue
+
                     # Get the request ID from the response
                     request_id = response.get("id")
                     if request_id is None:
@@ -155,8 +174,8 @@ class MCPProcess:
                     else:
                         voitta_log(
                             f"Received response for unknown request ID: {request_id}")
-                except json.JSONDecodeError:
-                    voitta_log(f"Failed to parse MCP response: {line_str}")
+                except ValueError:
+                    voitta_log(f"Failed to parse MCP response: {line[:200]}")
                 except Exception as e:
                     voitta_log(f"Error processing MCP response: {e}")
         except asyncio.CancelledError:
@@ -185,8 +204,13 @@ class MCPProcess:
         except Exception as e:
             voitta_log(f"Unexpected error in stderr reader: {e}")
 
-    async def send_request(self, method, params=None):
-        """Send a request to the MCP server and wait for a response."""
+    async def send_request(self, method, params=None, raw=False):
+        """
+        Send a request to the MCP server and wait for a response.
+
+        With `raw`, a result the codec left undecoded (passthrough mode) is
+        returned as RawJSON text instead of being parsed.
+        """
         if not self.is_running():
             await self.start()
 
@@ -210,11 +234,11 @@ class MCPProcess:
         self.pending_requests[request_id] = future
 
         # Send the request
-        request_json = json.dumps(request) + "\n"
-        voitta_log(f"Sending request to MCP: {request_json.strip()}")
+        request_bytes = voitta_json.dumps_bytes(request) + b"\n"
+        voitta_log(f"Sending {method} request to MCP")
 
         try:
-            self.process.stdin.write(request_json.encode('utf-8'))
+            self.process.stdin.write(request_bytes)
             await self.process.stdin.drain()
         except (BrokenPipeError, ConnectionResetError) as e:
             voitta_log(f"Pipe error when sending request: {e}")
@@ -242,7 +266,10 @@ class MCPProcess:
 
             # Return the result field as per JSON-RPC 2.0 specification
             if "result" in response:
-                return response["result"]
+                result = response["result"]
+                if isinstance(result, RawJSON) and not raw:
+                    result = voitta_json.loads(result)
+                return result
             else:
                 voitta_log(
                     f"Invalid JSON-RPC response: missing 'result' field: {response}")
@@ -291,6 +318,7 @@ class MCPServerDescription:
         self.operationIds = {}
         self.prompt = "These functions are available from MCP servers:"
         self.server_processes = {}
+        self.tools_loaded = False
 
         # Load MCP configuration
         with open(self.config_path, 'r') as f:
@@ -323,6 +351,15 @@ class MCPServerDescription:
 
         # Run all discovery tasks concurrently
         await asyncio.gather(*discovery_tasks)
+        self._sort_tools()
+
+    def _sort_tools(self):
+        """
+        Order tools by server and tool name, so the catalog does not depend on
+        which server answered first
+        """
+        self.tools = sorted(self.tools, key=lambda tool: (tool["server"], tool["tool"]))
+        self.operationIds = {tool["name"]: i for i, tool in enumerate(self.tools)}
 
     async def _discover_server_tools(self, server_name, server_config):
         """
@@ -378,6 +415,9 @@ class MCPServerDescription:
                 f"No tools result from MCP server: {server_name} after trying multiple methods")
             return
 
+        # Drop tools registered by an earlier discovery of this server
+        self._remove_server_tools(server_name)
+
         # Register each tool
         for tool in tools_result["tools"]:
             tool_name = tool.get("name")
@@ -407,14 +447,52 @@ class MCPServerDescription:
                 tool_name=tool_name,
                 description=description,
                 parameters=parameters,
-                required=required
+                required=required,
+                annotations=tool.get("annotations")
             )
         voitta_log(f"Found {len(self.tools)} tools")
 
-    def _add_tool(self, server_name, tool_name, description, parameters, required=None):
+    async def stop_all(self):
+        """Stop all running MCP server processes"""
+        for process in list(self.server_processes.values()):
+            await process.stop()
+
+    def _remove_server_tools(self, server_name):
+        """Forget all tools registered for a server"""
+        self.tools = [tool for tool in self.tools if tool["server"] != server_name]
+        self.operationIds = {tool["name"]: i for i, tool in enumerate(self.tools)}
+
+    def load_tools(self, tools):
+        """
+        Register a previously discovered tool list (e.g. from a catalog snapshot).
+
+        Server processes are started on the first call to one of their tools.
+        """
+        self.tools = [dict(tool) for tool in tools]
+        self._sort_tools()
+        self.tools_loaded = True
+
+    async def _get_process(self, server_name):
+        """Return the running process for a server, starting it if needed"""
+        process = self.server_processes.get(server_name)
+        if process is None and server_name in self.servers:
+            server_config = self.servers[server_name]
+            command = server_config.get('command')
+            if command:
+                process = MCPProcess(command, server_config.get('args', []),
+                                     server_config.get('env', {}))
+                self.server_processes[server_name] = process
+        if process is not None and not process.is_running():
+            await process.start()
+        return process
+
+    def _add_tool(self, server_name, tool_name, description, parameters, required=None,
+                  annotations=None):
         """Helper method to add a tool to the tools list"""
         if required is None:
             required = []
+        if annotations is None:
+            annotations = {}
 
         # Sanitize server_name and tool_name to ensure they only contain allowed characters
         import re
@@ -432,36 +510,35 @@ class MCPServerDescription:
             "tool": tool_name,
             "description": description,
             "parameters": parameters,
-            "required": required
+            "required": required,
+            "annotations": annotations
         })
 
-    def get_tools(self, prefix, delimiter="__"):
-        """Get tool definitions in the format expected by OpenAI"""
-        result = []
-        # Keep track of used names for disambiguation
-        used_names = {}
-
-        for i, tool in enumerate(self.tools):
-            # Process properties to handle array types properly
-            properties = {}
-            for param, param_info in tool["parameters"].items():
-                param_type = param_info["type"]
-                param_schema = {
-                    "type": param_type,
-                    "description": param_info["description"]
-                }
+    def is_idempotent(self, name):
+        """
+        True if the server annotates tool `name` as read-only or idempotent, unless
+        the server's config entry has `"singleflight": false`
+        """
+        if name not in self.operationIds:
+            return False
+        tool = self.tools[self.operationIds[name]]
+        if self.servers.get(tool["server"], {}).get("singleflight") is False:
+            return False
+        annotations = tool.get("annotations") or {}
+        return bool(annotations.get("readOnlyHint") or annotations.get("idempotentHint"))
 
-                # Add items property for array parameters
-                if param_type == "array":
-                    # For paths parameter, assume it's an array of strings
-                    if param == "paths":
-                        param_schema["items"] = {"type": "string"}
-                    else:
-                        # For other arrays, use a generic string type if we don't know
-                        param_schema["items"] = {"type": "string"}
+    def exposed_names(self, prefix, delimiter="__"):
+        """
+        Function names under which get_tools() exposes the tools, in tool order.
 
-                properties[param] = param_schema
+        Names longer than 64 characters are shortened (and disambiguated with a
+        sequence number, or replaced by a hash as a last resort).
+        """
+        names = []
+        # Keep track of used names for disambiguation
+        used_names = {}
 
+        for tool in self.tools:
             # Create function name and ensure it doesn't exceed 64 characters
             base_name = f"{prefix}{delimiter}{tool['name']}"
 
@@ -510,7 +587,6 @@ class MCPServerDescription:
 
                 # Final check - if still too long, use MD5 hash as last resort
                 if len(full_name) > 64:
-                    import hashlib
                     name_hash = hashlib.md5(
                         tool['name'].encode()).hexdigest()[:8]
                     full_name = f"{prefix}{delimiter}tool_{name_hash}"
@@ -518,8 +594,33 @@ class MCPServerDescription:
                 voitta_log(f"Shortened tool name: {tool['name']} -> {full_name}")
 
             # Final sanitization to ensure the function name only contains allowed characters
-            import re
-            sanitized_full_name = re.sub(r'[^a-zA-Z0-9_-]', '_', full_name)
+            names.append(re.sub(r'[^a-zA-Z0-9_-]', '_', full_name))
+        return names
+
+    def get_tools(self, prefix, delimiter="__"):
+        """Get tool definitions in the format expected by OpenAI"""
+        result = []
+
+        for tool, sanitized_full_name in zip(self.tools, self.exposed_names(prefix, delimiter)):
+            # Process properties to handle array types properly
+            properties = {}
+            for param, param_info in tool["parameters"].items():
+                param_type = param_info["type"]
+                param_schema = {
+                    "type": param_type,
+                    "description": param_info["description"]
+                }
+
+                # Add items property for array parameters
+                if param_type == "array":
+                    # For paths parameter, assume it's an array of strings
+                    if param == "paths":
+                        param_schema["items"] = {"type": "string"}
+                    else:
+                        # For other arrays, use a generic string type if we don't know
+                        param_schema["items"] = {"type": "string"}
+
+                properties[param] = param_schema
 
             result.append({
                 "type": "function",
@@ -537,8 +638,13 @@ class MCPServerDescription:
             })
         return result
 
-    async def call_function(self, name, arguments, token, oauth_token):
-        """Call an MCP tool function"""
+    async def call_function(self, name, arguments, token, oauth_token, on_progress=None):
+        """
+        Call an MCP tool function.
+
+        If given, `on_progress` is called with the params of every progress
+        notification the server sends for this call.
+        """
         if name not in self.operationIds:
             raise ValueError(f"Name {name} not found")
 
@@ -548,7 +654,7 @@ class MCPServerDescription:
         tool_name = tool["tool"]
 
         # Get the server process
-        process = self.server_processes.get(server_name)
+        process = await self._get_process(server_name)
         if not process or not process.is_running():
             return json.dumps({
                 "status": "error",
@@ -556,12 +662,22 @@ class MCPServerDescription:
             })
 
         # Call the MCP server with the standard method name and parameters according to the specification
-        result = await process.send_request("tools/call", {
+        params = {
             "name": tool_name,
             "arguments": arguments
-        })
+        }
+        progress_token = None
+        if on_progress is not None:
+            progress_token = uuid.uuid4().hex
+            params["_meta"] = {"progressToken": progress_token}
+            process.progress_handlers[progress_token] = on_progress
+        try:
+            result = await process.send_request("tools/call", params, raw=True)
+        finally:
+            if progress_token is not None:
+                process.progress_handlers.pop(progress_token, None)
 
-        if not result:
+        if not result or result == "null":
             return json.dumps({
                 "status": "error",
                 "message": f"Failed to call MCP tool {tool_name} on server {server_name}"
@@ -569,14 +685,52 @@ class MCPServerDescription:
 
         # Format the response according to the expected format
         # Check if the result is already a string (possibly JSON)
+        if isinstance(result, RawJSON):
+            # Forwarded as received (passthrough mode)
+            return result
         if isinstance(result, str):
-            try:
-                # Try to parse it as JSON to ensure it's valid
-                json.loads(result)
+            if voitta_json.is_json(result):
                 return result  # Return as is if it's valid JSON
-            except json.JSONDecodeError:
-                # If it's not valid JSON, wrap it in a JSON object
-                return json.dumps({"content": result})
+            # If it's not valid JSON, wrap it in a JSON object
+            return voitta_json.dumps({"content": result})
         else:
             # If it's not a string, convert it to JSON
-            return json.dumps(result)
+            return voitta_json.dumps(result)
+
+    async def stream_function(self, name, arguments, token, oauth_token,
+                              chunk_size=DEFAULT_CHUNK_SIZE, max_progress=DEFAULT_MAX_PROGRESS):
+        """
+        Call an MCP tool and yield its progress notifications as they arrive
+        (dicts with `progress`, `total` and `message`), then the result as
+        bytes chunks of up to `chunk_size`.
+
+        At most `max_progress` notifications are queued; if the consumer falls
+        behind, the oldest ones are dropped.
+        """
+        progress = collections.deque(maxlen=max_progress)
+        wakeup = asyncio.Event()
+
+        def on_progress(params):
+            progress.append({key: params[key] for key in ("progress", "total", "message")
+                             if key in params})
+            wakeup.set()
+
+        call = asyncio.ensure_future(
+            self.call_function(name, arguments, token, oauth_token, on_progress=on_progress))
+        try:
+            while True:
+                while progress:
+                    yield progress.popleft()
+                if call.done():
+                    break
+                wakeup.clear()
+                waiter = asyncio.ensure_future(wakeup.wait())
+                await asyncio.wait([call, waiter], return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+
+            result = call.result().encode("utf-8")
+            for start in range(0, len(result), chunk_size):
+                yield result[start:start + chunk_size]
+        finally:
+            if not call.done():
+                call.cancel()
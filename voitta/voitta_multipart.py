@@ -0,0 +1,161 @@
+import asyncio
+import mimetypes
+import os
+
+from .voitta_stream import DEFAULT_CHUNK_SIZE
+
+def voitta_log(message):
+    return
+
+
+def guess_content_type(filename, default="application/octet-stream"):
+    content_type, _ = mimetypes.guess_type(filename or "")
+    return content_type or default
+
+
+def source_size(value):
+    """Size in bytes of an upload source, or None if it is only known once read"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, os.PathLike):
+        return os.stat(value).st_size
+    return None
+
+
+def quote(name):
+    return name.replace('"', "%22")
+
+
+def field_to_str(value):
+    """Text of a plain form field, encoded the way httpx encodes form data"""
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if value is None:
+        return ""
+    return str(value)
+
+
+async def iter_source(value, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the content of an upload source as bytes chunks without copying it as a
+    whole: bytes-like objects slice by slice, files and paths read in blocks in the
+    default executor, async iterators as they come.
+    """
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        view = memoryview(value).cast("B")
+        for start in range(0, view.nbytes, chunk_size):
+            # Copy one chunk at a time: ASGI servers (and httpx.ASGITransport)
+            # only accept bytes bodies, not memoryviews
+            yield bytes(view[start:start + chunk_size])
+    elif isinstance(value, os.PathLike):
+        loop = asyncio.get_running_loop()
+        with open(value, "rb") as f:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    elif hasattr(value, "read"):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, value.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    elif hasattr(value, "__aiter__"):
+        async for chunk in value:
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    else:
+        raise TypeError(f"Unsupported upload source: {type(value).__name__}")
+
+
+class MultipartEncoder:
+    """
+    Streaming multipart/form-data body for httpx's `content=` argument.
+
+    `files` maps field names to (filename, source, content_type) where source is
+    str, bytes, bytearray, memoryview, an os.PathLike, a binary file object or an
+    async iterator of bytes. File contents are streamed in `chunk_size` pieces
+    and never joined into one buffer. Content-Length is sent when every size is
+    known up front, otherwise the body goes out chunked.
+    """
+
+    def __init__(self, data=None, files=None, chunk_size=DEFAULT_CHUNK_SIZE, boundary=None):
+        self.data = data or {}
+        self.files = files or {}
+        self.chunk_size = chunk_size
+        self.boundary = boundary or os.urandom(16).hex()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _field_header(self, name):
+        return (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{quote(name)}"\r\n\r\n').encode("utf-8")
+
+    def _file_header(self, name, filename, content_type):
+        return (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{quote(name)}"; filename="{quote(filename)}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n').encode("utf-8")
+
+    def _fields(self):
+        for name, value in self.data.items():
+            for item in value if isinstance(value, (list, tuple)) else [value]:
+                yield name, field_to_str(item).encode("utf-8")
+
+    def content_length(self):
+        """Total body size, or None if a source has no known size"""
+        length = 0
+        for name, value in self._fields():
+            length += len(self._field_header(name)) + len(value) + 2
+        for name, (filename, source, content_type) in self.files.items():
+            size = source_size(source)
+            if size is None:
+                return None
+            length += len(self._file_header(name, filename, content_type)) + size + 2
+        return length + len(f"--{self.boundary}--\r\n")
+
+    def headers(self):
+        headers = {"Content-Type": self.content_type}
+        length = self.content_length()
+        if length is not None:
+            headers["Content-Length"] = str(length)
+        return headers
+
+    async def __aiter__(self):
+        for name, value in self._fields():
+            yield self._field_header(name)
+            yield value
+            yield b"\r\n"
+        for name, (filename, source, content_type) in self.files.items():
+            yield self._file_header(name, filename, content_type)
+            async for chunk in iter_source(source, self.chunk_size):
+                yield chunk
+            yield b"\r\n"
+        yield f"--{self.boundary}--\r\n".encode("utf-8")
+
+
+def upload_file(source, filename=None):
+    """
+    (filename, source, content_type) tuple for a `format: binary` argument.
+
+    Paths keep their own name unless `filename` is given; the content type is
+    guessed from the filename, with text/plain for str and
+    application/octet-stream for other sources as the fallback.
+    """
+    if filename is None and isinstance(source, os.PathLike):
+        filename = os.path.basename(os.fspath(source))
+    filename = filename or "unknown"
+    if isinstance(source, str):
+        return filename, source.encode("utf-8"), guess_content_type(filename, "text/plain")
+    return filename, source, guess_content_type(filename)
@@ -0,0 +1,470 @@
+import abc
+import asyncio
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from . import voitta_json
+from .voitta_loop import LoopLocal
+
+def voitta_log(message):
+    return
+
+# Optional batch endpoint of the HTTP reference provider: takes a list of `keys`
+# and returns {"data": {key: value, ...}}
+RETRIEVE_VALUES_OPERATION = "retrieve_values_api_retrieve_values_post"
+RETRIEVE_VALUE_OPERATION = "retrieve_value_api_retrieve_value_post"
+STORE_VALUE_OPERATION = "store_value_api_store_value_post"
+
+
+# Marks a key that a store does not have (None is a valid stored value)
+_missing = object()
+
+
+def encode_value(value):
+    """Canonical JSON encoding of a stored value and its content address"""
+    data = voitta_json.dumps_bytes(value, sort_keys=True)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def decode_value(data):
+    return voitta_json.loads(data)
+
+
+class ReferenceStore(abc.ABC):
+    """
+    Storage for tool results that the LLM refers to by tool_call_id.
+
+    `token` and `oauth_token` are the credentials of the current tool call;
+    local backends ignore them.
+    """
+
+    @abc.abstractmethod
+    async def get_many(self, keys, token=None, oauth_token=None):
+        """Return {key: value} for the `keys` that are stored; missing keys are left out"""
+
+    @abc.abstractmethod
+    async def put(self, key, value, token=None, oauth_token=None):
+        """Store `value` under `key`"""
+
+    async def put_many(self, items, token=None, oauth_token=None):
+        """Store several (key, value) pairs"""
+        await asyncio.gather(*[self.put(key, value, token, oauth_token) for key, value in items])
+
+    async def get(self, key, token=None, oauth_token=None):
+        values = await self.get_many([key], token, oauth_token)
+        return values.get(key)
+
+    async def aclose(self):
+        return
+
+
+class MemoryReferenceStore(ReferenceStore):
+    """
+    In-process LRU store bounded by the total size of the stored values.
+
+    Values are kept as canonical JSON and addressed by their SHA-256 digest, so
+    a large payload returned by several tool calls is held only once.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._keys = collections.OrderedDict()  # key -> digest, in LRU order
+        self._blobs = {}  # digest -> [data, number of keys pointing to it]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _release(self, digest):
+        blob = self._blobs[digest]
+        blob[1] -= 1
+        if blob[1] == 0:
+            self.size -= len(blob[0])
+            del self._blobs[digest]
+
+    def put_sync(self, key, value):
+        data, digest = encode_value(value)
+        with self._lock:
+            if key in self._keys:
+                self._release(self._keys.pop(key))
+
+            if digest in self._blobs:
+                self._blobs[digest][1] += 1
+            else:
+                self._blobs[digest] = [data, 1]
+                self.size += len(data)
+            self._keys[key] = digest
+
+            # Evict least recently used keys, but never the one just written
+            while self.size > self.max_bytes and len(self._keys) > 1:
+                old_key, old_digest = self._keys.popitem(last=False)
+                self._release(old_digest)
+                voitta_log(f"Evicted reference {old_key}")
+
+    def get_sync(self, key, default=None):
+        with self._lock:
+            digest = self._keys.get(key)
+            if digest is None:
+                return default
+            self._keys.move_to_end(key)
+            data = self._blobs[digest][0]
+        return decode_value(data)
+
+    async def get_many(self, keys, token=None, oauth_token=None):
+        values = {}
+        for key in keys:
+            value = self.get_sync(key, _missing)
+            if value is not _missing:
+                values[key] = value
+        return values
+
+    async def put(self, key, value, token=None, oauth_token=None):
+        self.put_sync(key, value)
+
+    async def put_many(self, items, token=None, oauth_token=None):
+        for key, value in items:
+            self.put_sync(key, value)
+
+
+class SQLiteReferenceStore(ReferenceStore):
+    """
+    Local on-disk store in an SQLite database in WAL mode.
+
+    Values are content-addressed like in MemoryReferenceStore and bounded the
+    same way: once they take more than `max_bytes` (None: no limit), the least
+    recently used keys are evicted. Values that no key points to any more are
+    deleted as part of each write. Queries run in the default executor so that
+    they don't block the event loop.
+    """
+
+    def __init__(self, path="~/.cache/voitta/references.db", max_bytes=1024 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS refs (key TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+                "used REAL NOT NULL DEFAULT 0)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            # Databases written by earlier versions have no access times
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(refs)")]
+            if "used" not in columns:
+                self._connection.execute("ALTER TABLE refs ADD COLUMN used REAL NOT NULL DEFAULT 0")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS refs_used ON refs (used)")
+            self._connection.commit()
+        self.prune()
+
+    def _delete_orphans(self, digests):
+        """Delete the values among `digests` that no key points to"""
+        digests = list(set(digests))
+        if not digests:
+            return
+        placeholders = ",".join("?" for _ in digests)
+        rows = self._connection.execute(
+            f"SELECT digest, length(value) FROM blobs WHERE digest IN ({placeholders}) "
+            f"AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.digest = blobs.digest)",
+            digests).fetchall()
+        self._connection.executemany("DELETE FROM blobs WHERE digest = ?",
+                                     [(digest,) for digest, _ in rows])
+        self.size -= sum(length for _, length in rows)
+
+    def _evict(self, keep):
+        """Delete least recently used keys, but none of `keep`, until the values fit max_bytes"""
+        while self.size > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT key, digest FROM refs ORDER BY used LIMIT 64").fetchall()
+            rows = [(key, digest) for key, digest in rows if key not in keep]
+            if not rows:
+                break
+            for key, digest in rows:
+                self._connection.execute("DELETE FROM refs WHERE key = ?", (key,))
+                self._delete_orphans([digest])
+                voitta_log(f"Evicted reference {key}")
+                if self.size <= self.max_bytes:
+                    break
+
+    def put_many_sync(self, items):
+        rows = {}
+        blobs = {}
+        now = time.time()
+        for key, value in items:
+            data, digest = encode_value(value)
+            rows[key] = (key, digest, now)
+            blobs[digest] = data
+
+        if not rows:
+            return
+        keys = list(rows)
+        digests = list(blobs)
+        with self._lock:
+            # Values of the keys being replaced may be left without a key
+            replaced = [row[0] for row in self._connection.execute(
+                f"SELECT digest FROM refs WHERE key IN ({','.join('?' for _ in keys)})", keys)]
+            present = {row[0] for row in self._connection.execute(
+                f"SELECT digest FROM blobs WHERE digest IN ({','.join('?' for _ in digests)})",
+                digests)}
+            new_blobs = [(digest, data) for digest, data in blobs.items() if digest not in present]
+            self._connection.executemany(
+                "INSERT INTO blobs (digest, value) VALUES (?, ?)", new_blobs)
+            self.size += sum(len(data) for _, data in new_blobs)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO refs (key, digest, used) VALUES (?, ?, ?)", rows.values())
+            self._delete_orphans(replaced)
+            if self.max_bytes is not None:
+                self._evict(set(keys))
+            self._connection.commit()
+
+    def get_many_sync(self, keys):
+        values = {}
+        if not keys:
+            return values
+
+        placeholders = ",".join("?" for _ in keys)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT refs.key, blobs.value FROM refs JOIN blobs ON refs.digest = blobs.digest "
+                f"WHERE refs.key IN ({placeholders})", list(keys)).fetchall()
+            if rows and self.max_bytes is not None:
+                self._connection.executemany("UPDATE refs SET used = ? WHERE key = ?",
+                                             [(time.time(), key) for key, _ in rows])
+                self._connection.commit()
+        for key, data in rows:
+            values[key] = decode_value(data)
+        return values
+
+    def prune(self):
+        """Delete values that no key points to any more"""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM blobs WHERE NOT EXISTS "
+                "(SELECT 1 FROM refs WHERE refs.digest = blobs.digest)")
+            self._connection.commit()
+            self.size = self._connection.execute(
+                "SELECT COALESCE(SUM(length(value)), 0) FROM blobs").fetchone()[0]
+
+    async def get_many(self, keys, token=None, oauth_token=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_many_sync, list(keys))
+
+    async def put(self, key, value, token=None, oauth_token=None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.put_many_sync, [(key, value)])
+
+    async def put_many(self, items, token=None, oauth_token=None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.put_many_sync, list(items))
+
+    async def aclose(self):
+        with self._lock:
+            self._connection.close()
+
+
+class HTTPReferenceStore(ReferenceStore):
+    """The `role: reference_provider` endpoint (store_value / retrieve_value over HTTP)"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    async def get_many(self, keys, token=None, oauth_token=None):
+        keys = list(keys)
+        endpoint = self.endpoint
+
+        if len(keys) > 1 and RETRIEVE_VALUES_OPERATION in endpoint.operationIds:
+            result = await endpoint.call_function(RETRIEVE_VALUES_OPERATION,
+                                                  {"keys": keys}, token, oauth_token)
+            try:
+                data = voitta_json.loads(result)["data"]
+            except (ValueError, KeyError, TypeError):
+                data = None
+            # An error envelope means the provider has none of the keys, like below
+            if not isinstance(data, dict):
+                return {}
+            return {key: data[key] for key in keys if data.get(key) is not None}
+
+        async def retrieve(key):
+            value = await endpoint.call_function(RETRIEVE_VALUE_OPERATION,
+                                                 {"key": key}, token, oauth_token)
+            try:
+                response = voitta_json.loads(value)
+            except ValueError:
+                return value
+            if isinstance(response, dict) and "data" in response:
+                # No data (or an error envelope) means the provider has no such key
+                return _missing if response["data"] is None else response["data"]
+            return value
+
+        values = await asyncio.gather(*[retrieve(key) for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not _missing}
+
+    async def put(self, key, value, token=None, oauth_token=None):
+        await self.endpoint.call_function(STORE_VALUE_OPERATION,
+                                          {"key": key, "value": value},
+                                          token, oauth_token)
+
+
+class WriteBehindReferenceStore(ReferenceStore):
+    """
+    Wrapper that acknowledges writes immediately and stores them in the background.
+
+    Pending values are kept in memory until the wrapped store has accepted them,
+    and reads of a pending key are answered from that buffer (read-your-writes).
+    Writes are sent in batches of up to `batch_size`, retried `max_retries` times;
+    values that still fail stay readable in-process and are counted in `failed`.
+    Call flush() (or aclose()) before shutdown.
+    """
+
+    def __init__(self, store, batch_size=32, flush_interval=0.01, max_retries=3, retry_delay=0.5):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.failed = {}
+        self._pending = {}  # key -> (value, token, oauth_token)
+        self._lock = threading.Lock()
+        self._writers = LoopLocal()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _new_writer(self):
+        return {"queue": [], "wakeup": asyncio.Event(), "idle": asyncio.Event(), "task": None}
+
+    def _writer(self):
+        writer = self._writers.get(self._new_writer)
+        if writer["task"] is None or writer["task"].done():
+            writer["task"] = asyncio.ensure_future(self._write_loop(writer))
+        return writer
+
+    async def _write_loop(self, writer):
+        while True:
+            if not writer["queue"]:
+                writer["idle"].set()
+                writer["wakeup"].clear()
+                await writer["wakeup"].wait()
+            # Give concurrent puts a moment to join the batch
+            await asyncio.sleep(self.flush_interval)
+
+            batch = writer["queue"][:self.batch_size]
+            del writer["queue"][:self.batch_size]
+            await self._write_batch(batch)
+
+    async def _write_batch(self, keys):
+        with self._lock:
+            entries = [(key, self._pending[key]) for key in keys if key in self._pending]
+
+        # Credentials differ per tool call, so group writes by them
+        groups = {}
+        for key, (value, token, oauth_token) in entries:
+            groups.setdefault((token, oauth_token), []).append((key, value))
+
+        for (token, oauth_token), items in groups.items():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.store.put_many(items, token, oauth_token)
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    voitta_log(f"Write-behind attempt {attempt + 1} failed: {e}")
+                    await asyncio.sleep(self.retry_delay * (2 ** attempt))
+
+            with self._lock:
+                for key, value in items:
+                    entry = self._pending.get(key)
+                    # A newer put of the same key is still queued
+                    if entry is None or entry[0] is not value:
+                        continue
+                    del self._pending[key]
+                    if error is not None:
+                        self.failed[key] = value
+
+    async def put(self, key, value, token=None, oauth_token=None):
+        with self._lock:
+            self._pending[key] = (value, token, oauth_token)
+            self.failed.pop(key, None)
+        writer = self._writer()
+        writer["queue"].append(key)
+        writer["idle"].clear()
+        writer["wakeup"].set()
+
+    async def get_many(self, keys, token=None, oauth_token=None):
+        values = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._pending:
+                    values[key] = self._pending[key][0]
+                elif key in self.failed:
+                    values[key] = self.failed[key]
+                else:
+                    missing.append(key)
+
+        if missing:
+            values.update(await self.store.get_many(missing, token, oauth_token))
+        return values
+
+    async def flush(self, loops=None):
+        """
+        Wait until every pending write has been handed to the wrapped store,
+        or only the writes queued on `loops`
+        """
+        current_loop = asyncio.get_running_loop()
+        for loop, writer in self._writers.pop_all(loops):
+            if writer["task"] is None:
+                continue
+            if loop is current_loop:
+                await writer["idle"].wait()
+                writer["task"].cancel()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(self._drain(writer), loop)
+                await asyncio.wrap_future(future)
+
+    @staticmethod
+    async def _drain(writer):
+        await writer["idle"].wait()
+        writer["task"].cancel()
+
+    async def aclose(self):
+        await self.flush()
+        await self.store.aclose()
+
+
+def get_reference_store(reference_store):
+    """
+    Normalize the `reference_store` router option: a ReferenceStore, or a dict
+    such as {"type": "memory", "max_bytes": 67108864} or {"type": "sqlite", "path": ...}
+    """
+    if reference_store is None or isinstance(reference_store, ReferenceStore):
+        return reference_store
+
+    if isinstance(reference_store, str):
+        reference_store = {"type": reference_store}
+
+    store_type = reference_store.get("type", "memory")
+    if store_type == "http":
+        # The router wraps its `role: reference_provider` endpoint
+        return None
+    if store_type == "memory":
+        return MemoryReferenceStore(
+            max_bytes=reference_store.get("max_bytes", 64 * 1024 * 1024))
+    if store_type == "sqlite":
+        return SQLiteReferenceStore(
+            path=reference_store.get("path", "~/.cache/voitta/references.db"),
+            max_bytes=reference_store.get("max_bytes", 1024 * 1024 * 1024))
+    raise ValueError(f"Unknown reference store type: {store_type}")
@@ -0,0 +1,50 @@
+import asyncio
+
+from .voitta_cache import make_key
+from .voitta_loop import LoopLocal
+
+def voitta_log(message):
+    return
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls into one.
+
+    While a call for a key is in flight, further calls with the same key wait
+    for its result instead of starting their own; the key is forgotten as soon
+    as the call finishes, so nothing is cached. In-flight calls are tracked per
+    event loop.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = LoopLocal()
+
+    async def do(self, key, factory):
+        """Return the result of `factory()`, sharing it with identical concurrent calls"""
+        inflight = self._inflight.get(dict)
+        future = inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            voitta_log(f"Coalesced call {key[0]}")
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(factory())
+            inflight[key] = future
+
+            def done(f):
+                if inflight.get(key) is f:
+                    del inflight[key]
+                # Mark the exception as retrieved even if every caller went away
+                if not f.cancelled():
+                    f.exception()
+
+            future.add_done_callback(done)
+
+        # One caller being cancelled must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced}
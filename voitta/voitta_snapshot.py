@@ -0,0 +1,111 @@
+import json
+import os
+import hashlib
+import time
+import zlib
+
+def voitta_log(message):
+    return
+
+SNAPSHOT_MAGIC = b"VOITTA-CATALOG\n"
+SNAPSHOT_VERSION = 1
+
+
+def canonical_json(obj):
+    """Deterministic JSON text used for fingerprints and snapshot files"""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def fingerprint(obj):
+    return hashlib.sha256(canonical_json(obj).encode("utf-8")).hexdigest()
+
+
+def config_fingerprint(endpoints, mcp=None, tool_delimiter="____"):
+    """
+    Fingerprint of a parsed router configuration.
+
+    Args:
+        endpoints: List of (name, info) tuples
+        mcp: MCP config dict ({"path": ..., "type": ...}) or MCPServerDescription
+        tool_delimiter: Delimiter used in tool names
+    """
+    mcp_part = None
+    if mcp is not None:
+        if isinstance(mcp, dict):
+            config_path, config_type = mcp.get("path"), mcp.get("type", "cline")
+            if config_path:
+                config_path = os.path.expanduser(config_path)
+        else:
+            config_path, config_type = mcp.config_path, mcp.config_type
+
+        mcp_servers = None
+        if config_path:
+            try:
+                with open(os.path.expanduser(config_path), "r") as f:
+                    mcp_servers = json.load(f)
+            except (OSError, ValueError) as e:
+                voitta_log(f"Could not read MCP config {config_path}: {e}")
+        mcp_part = {"type": config_type, "servers": mcp_servers}
+
+    return fingerprint({
+        "endpoints": [[name, info] for name, info in endpoints],
+        "mcp": mcp_part,
+        "tool_delimiter": tool_delimiter
+    })
+
+
+def build_snapshot(router):
+    """
+    Capture everything a router needs to start without network access.
+
+    The catalog part (endpoints, tool descriptors, MCP tool lists, prompts) is
+    fingerprinted so that a freshly built router can be compared against it.
+    """
+    catalog = {
+        "tool_delimiter": router.tool_delimiter,
+        "endpoint_ids": router.endpoint_ids,
+        "endpoints": [endpoint.to_dict() for endpoint in router.endpoints],
+        "canvas": router.canvas is not None,
+        "reference_provider": router.reference_provider.name
+        if router.reference_provider is not None else None,
+        "mcp": None
+    }
+    if router.mcp is not None:
+        catalog["mcp"] = {
+            "config_path": router.mcp.config_path,
+            "config_type": router.mcp.config_type,
+            "tools": router.mcp.tools
+        }
+
+    snapshot = dict(catalog)
+    snapshot.update({
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.time(),
+        "config_fingerprint": router.config_fingerprint,
+        "catalog_fingerprint": fingerprint(catalog),
+        "tools": router.get_tools(),
+        "prompt": router.get_prompt()
+    })
+    return snapshot
+
+
+def write_snapshot(snapshot, path):
+    payload = SNAPSHOT_MAGIC + zlib.compress(canonical_json(snapshot).encode("utf-8"))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    with open(path, "rb") as f:
+        payload = f.read()
+
+    if not payload.startswith(SNAPSHOT_MAGIC):
+        raise ValueError(f"{path} is not a Voitta catalog snapshot")
+
+    snapshot = json.loads(zlib.decompress(payload[len(SNAPSHOT_MAGIC):]))
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot version {snapshot.get('version')} in {path}")
+    return snapshot
@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+def voitta_log(message):
+    return
+
+DEFAULT_THRESHOLD = 256 * 1024
+DEFAULT_PREVIEW_BYTES = 2048
+DEFAULT_PAGE_BYTES = 64 * 1024
+
+
+class ResultSpool:
+    """
+    Local files for tool results that are too large to return inline.
+
+    A result bigger than `threshold` bytes is written to a file under `path`
+    (a fresh temporary directory by default) and replaced by a short JSON
+    preview with a `spool_...` handle; read() pages through the full result by
+    byte offset. Files live until remove() or close().
+    """
+
+    def __init__(self, path=None, threshold=DEFAULT_THRESHOLD, preview_bytes=DEFAULT_PREVIEW_BYTES):
+        if preview_bytes >= threshold:
+            raise ValueError(f"preview_bytes ({preview_bytes}) must be smaller than "
+                             f"threshold ({threshold})")
+        self.threshold = threshold
+        self.preview_bytes = preview_bytes
+        self._owns_path = path is None
+        self.path = tempfile.mkdtemp(prefix="voitta-spool-") if path is None else os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._sizes = {}  # handle -> size in bytes
+        self._lock = threading.Lock()
+
+    def __contains__(self, handle):
+        return handle in self._sizes
+
+    def _file(self, handle):
+        if handle not in self._sizes:
+            raise KeyError(f"Unknown result handle: {handle}")
+        return os.path.join(self.path, handle)
+
+    def _open_new(self):
+        handle = f"spool_{uuid.uuid4().hex}"
+        # The directory is gone after close(); the spool stays usable
+        os.makedirs(self.path, exist_ok=True)
+        return handle, open(os.path.join(self.path, handle), "wb")
+
+    def _preview(self, handle, size, head):
+        with self._lock:
+            self._sizes[handle] = size
+        preview = head[:self.preview_bytes].decode("utf-8", errors="ignore")
+        voitta_log(f"Spooled {size} bytes to {handle}")
+        return json.dumps({
+            "status": "ok",
+            "truncated": True,
+            "handle": handle,
+            "size": size,
+            "preview": preview,
+            "message": (f"The result is {size} bytes long; only the beginning is shown. "
+                        f"Read the rest by offset and length with the handle.")
+        })
+
+    def offload(self, text):
+        """Return `text` as is, or a preview if it is above the threshold"""
+        if not isinstance(text, str) or len(text) <= self.threshold or self.is_preview(text):
+            return text
+        data = text.encode("utf-8")
+        if len(data) <= self.threshold:
+            return text
+
+        handle, f = self._open_new()
+        with f:
+            f.write(data)
+        return self._preview(handle, len(data), data[:self.preview_bytes])
+
+    async def collect(self, chunks):
+        """
+        Read an async iterator of bytes chunks; small bodies are returned as text,
+        larger ones go to disk as they arrive, so at most about `threshold` bytes
+        are held in memory.
+        """
+        buffer = bytearray()
+        handle = f = None
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if f is not None:
+                    f.write(chunk)
+                    continue
+                buffer += chunk
+                if len(buffer) > self.threshold:
+                    handle, f = self._open_new()
+                    f.write(buffer)
+                    head = bytes(buffer[:self.preview_bytes])
+                    buffer = None
+        except BaseException:
+            if f is not None:
+                f.close()
+                os.remove(os.path.join(self.path, handle))
+            raise
+
+        if f is None:
+            return buffer.decode("utf-8", errors="replace")
+        f.close()
+        return self._preview(handle, size, head)
+
+    def is_preview(self, text):
+        """True if `text` is a preview returned by offload() or collect()"""
+        if not isinstance(text, str) or not text.startswith('{"status": "ok", "truncated": true'):
+            return False
+        try:
+            return json.loads(text).get("handle") in self._sizes
+        except ValueError:
+            return False
+
+    def read(self, handle, offset=0, length=DEFAULT_PAGE_BYTES):
+        """
+        Read up to `length` bytes of a spooled result starting at byte `offset`.
+        The page never ends inside a UTF-8 character; continue from `next_offset`.
+        """
+        path = self._file(handle)
+        size = self._sizes[handle]
+        offset = max(0, min(offset, size))
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            # One byte more to see whether the page would split a character
+            chunk = f.read(length + 1)
+
+        end = min(length, len(chunk))
+        while 0 < end < len(chunk) and (chunk[end] & 0xC0) == 0x80:
+            end -= 1
+
+        return {
+            "handle": handle,
+            "offset": offset,
+            "length": end,
+            "size": size,
+            "next_offset": offset + end if offset + end < size else None,
+            "data": chunk[:end].decode("utf-8", errors="replace")
+        }
+
+    def remove(self, handle):
+        path = self._file(handle)
+        with self._lock:
+            del self._sizes[handle]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        """Delete all spooled results"""
+        with self._lock:
+            handles = list(self._sizes)
+            self._sizes.clear()
+        if self._owns_path:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        for handle in handles:
+            try:
+                os.remove(os.path.join(self.path, handle))
+            except OSError:
+                pass
+
+
+def get_result_spool(result_spool):
+    """
+    Normalize the `result_spool` router option: None/False, True, a dict such as
+    {"threshold": 262144, "preview_bytes": 2048, "path": ...}, or a ResultSpool
+    """
+    if result_spool is None or result_spool is False:
+        return None
+    if result_spool is True:
+        return ResultSpool()
+    if isinstance(result_spool, dict):
+        return ResultSpool(path=result_spool.get("path"),
+                           threshold=result_spool.get("threshold", DEFAULT_THRESHOLD),
+                           preview_bytes=result_spool.get("preview_bytes", DEFAULT_PREVIEW_BYTES))
+    return result_spool
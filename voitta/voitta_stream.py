@@ -0,0 +1,47 @@
+import asyncio
+
+def voitta_log(message):
+    return
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_BUFFER = 1024 * 1024
+
+_END = object()
+
+
+async def read_ahead(chunks, max_buffer=DEFAULT_MAX_BUFFER, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate over the async iterator `chunks` while a background task keeps
+    reading from it, so that a slow consumer (e.g. a UI connection) does not
+    stall the upstream read.
+
+    At most `max_buffer // chunk_size` chunks that the consumer has not taken
+    yet are held in memory; beyond that the reader waits. Errors of the source
+    are raised to the consumer, and closing the iterator early stops the reader.
+    """
+    queue = asyncio.Queue(maxsize=max(1, max_buffer // chunk_size))
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                await queue.put((chunk, None))
+            await queue.put((_END, None))
+        except Exception as e:
+            await queue.put((_END, e))
+
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            chunk, error = await queue.get()
+            if chunk is _END:
+                if error is not None:
+                    raise error
+                return
+            yield chunk
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                voitta_log("Stream closed before the end of the response")
@@ -0,0 +1,257 @@
+import collections
+import csv
+import io
+import threading
+import uuid
+
+from . import voitta_json
+
+def voitta_log(message):
+    return
+
+DEFAULT_MAX_TOKENS = 1000
+DEFAULT_MIN_ROWS = 5
+# Room left in the budget for the table caption and paging hint
+FOOTER_TOKENS = 60
+
+
+def estimate_tokens(text):
+    """Rough token count of `text` (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def format_cell(value):
+    if value is None:
+        return ""
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, (dict, list)):
+        return voitta_json.dumps(value)
+    return str(value)
+
+
+def unwrap_records(value):
+    """
+    Split a tool result into (envelope, records), or (None, None) if it holds
+    no list of homogeneous records.
+
+    `value` may be JSON text; both a bare list of objects (envelope None) and
+    the usual {"status": ..., "data": ...} envelope are recognized, with `data`
+    either a list or, as in VoittaResponse, JSON text of a list. The objects
+    count as homogeneous when, on average, they have at least half of all keys seen.
+    """
+    if isinstance(value, (str, bytes)):
+        try:
+            value = voitta_json.loads(value)
+        except ValueError:
+            return None, None
+    envelope = None
+    if isinstance(value, dict) and "data" in value:
+        data = value["data"]
+        if isinstance(data, str) and data.lstrip().startswith("["):
+            try:
+                data = voitta_json.loads(data)
+            except ValueError:
+                pass
+        if isinstance(data, list):
+            envelope, value = value, data
+    if not isinstance(value, list) or not value:
+        return None, None
+    if not all(isinstance(record, dict) and record for record in value):
+        return None, None
+
+    keys = set()
+    total = 0
+    for record in value:
+        keys.update(record)
+        total += len(record)
+    if total / len(value) < len(keys) / 2:
+        return None, None
+    return envelope, value
+
+
+def find_records(value):
+    """The list of homogeneous records in a tool result, or None (see unwrap_records)"""
+    return unwrap_records(value)[1]
+
+
+class Table:
+    """Record array kept as columns: {column name: list of cell values}"""
+
+    def __init__(self, columns, data, num_rows):
+        self.columns = columns
+        self.data = data
+        self.num_rows = num_rows
+
+    @classmethod
+    def from_records(cls, records):
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        data = {column: [record.get(column) for record in records] for column in columns}
+        return cls(columns, data, len(records))
+
+    def to_dataframe(self):
+        """The table as a pandas DataFrame (pandas is imported on first use)"""
+        import pandas as pd
+
+        return pd.DataFrame(self.data, columns=self.columns)
+
+    def _lines(self, columns, offset, limit, format):
+        """Header line and an iterator over row lines"""
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="")
+
+            def line(cells):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerow(cells)
+                return buffer.getvalue()
+
+            header = line(columns)
+        else:
+            def line(cells):
+                cells = [cell.replace("|", "\\|").replace("\n", " ") for cell in cells]
+                return "| " + " | ".join(cells) + " |"
+
+            header = line(columns) + "\n|" + "---|" * len(columns)
+
+        end = self.num_rows if limit is None else min(self.num_rows, offset + limit)
+        rows = (line([format_cell(self.data[column][i]) for column in columns])
+                for i in range(offset, end))
+        return header, rows
+
+    def render(self, columns=None, offset=0, limit=None, format="markdown", max_tokens=None,
+               min_rows=DEFAULT_MIN_ROWS):
+        """
+        Render rows from `offset` as CSV or a markdown table.
+
+        With `max_tokens`, rows are added while they fit the budget; if fewer
+        than `min_rows` would fit, the widest columns are left out until they do.
+
+        Returns:
+            A tuple of (text, number of rows shown, columns shown)
+        """
+        columns = [column for column in (columns or self.columns) if column in self.data]
+        offset = max(0, min(offset, self.num_rows))
+        available = self.num_rows - offset
+        if limit is not None:
+            available = min(available, limit)
+        wanted = min(min_rows, available)
+
+        while True:
+            header, rows = self._lines(columns, offset, limit, format)
+            lines = [header]
+            used = estimate_tokens(header)
+            for row in rows:
+                cost = estimate_tokens(row)
+                if max_tokens is not None and used + cost > max_tokens:
+                    break
+                lines.append(row)
+                used += cost
+
+            shown = len(lines) - 1
+            if shown >= wanted or len(columns) <= 1:
+                return "\n".join(lines), shown, columns
+
+            # Project away the column with the longest cells and try again
+            widths = {column: sum(len(format_cell(value)) for value in
+                                  self.data[column][offset:offset + wanted])
+                      for column in columns}
+            widest = max(widths, key=widths.get)
+            columns = [column for column in columns if column != widest]
+
+
+class ResultTables:
+    """
+    Router post-processing stage that renders record arrays as compact tables.
+
+    A result that is a list of homogeneous records is kept in memory as a
+    Table and rendered as markdown or CSV within `max_tokens`. When rows or
+    columns had to be left out, the table gets a `table_...` handle and
+    read() returns further pages. Up to `max_tables` tables are kept (LRU).
+    """
+
+    def __init__(self, format="markdown", max_tokens=DEFAULT_MAX_TOKENS,
+                 min_rows=DEFAULT_MIN_ROWS, max_tables=64):
+        self.format = format
+        self.max_tokens = max_tokens
+        self.min_rows = min_rows
+        self.max_tables = max_tables
+        self._tables = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, handle):
+        with self._lock:
+            table = self._tables.get(handle)
+            if table is None:
+                raise KeyError(f"Unknown table handle: {handle}")
+            self._tables.move_to_end(handle)
+        return table
+
+    def _keep(self, table):
+        handle = f"table_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._tables[handle] = table
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        return handle
+
+    def _page(self, handle, table, columns=None, offset=0, limit=None, format=None):
+        format = format or self.format
+        text, shown, shown_columns = table.render(
+            columns, offset, limit, format,
+            max_tokens=max(1, self.max_tokens - FOOTER_TOKENS), min_rows=self.min_rows)
+
+        omitted = [column for column in (columns or table.columns) if column not in shown_columns]
+        complete = offset == 0 and shown == table.num_rows and not omitted
+        if complete and handle is None:
+            return text
+
+        if handle is None:
+            handle = self._keep(table)
+        caption = (f"Table {handle}: rows {offset + 1}-{offset + shown} of {table.num_rows}, "
+                   f"{len(shown_columns)} of {len(table.columns)} columns")
+        notes = []
+        if offset + shown < table.num_rows:
+            notes.append(f"next rows from offset={offset + shown}")
+        if omitted:
+            notes.append(f"omitted columns: {', '.join(omitted)}")
+        footer = f"[{'; '.join(notes)}]" if notes else ""
+        return "\n".join(part for part in (caption, text, footer) if part)
+
+    def render_result(self, result):
+        """
+        The result rendered as a table, or unchanged if it is not a record array.
+        A table taken from an envelope is returned in the same envelope (as its
+        `data`), so `status` and `message` are kept.
+        """
+        envelope, records = unwrap_records(result)
+        if records is None:
+            return result
+        text = self._page(None, Table.from_records(records))
+        if envelope is None:
+            return text
+        return voitta_json.dumps({**envelope, "data": text})
+
+    def read(self, handle, offset=0, limit=None, columns=None, format=None):
+        """Another page of a stored table, optionally with a subset of its columns"""
+        return self._page(handle, self.get(handle), columns, offset, limit, format)
+
+
+def get_result_tables(result_tables):
+    """
+    Normalize the `result_tables` router option: None/False, True, a dict such as
+    {"format": "csv", "max_tokens": 1000, "min_rows": 5}, or a ResultTables
+    """
+    if result_tables is None or result_tables is False:
+        return None
+    if result_tables is True:
+        return ResultTables()
+    if isinstance(result_tables, dict):
+        return ResultTables(format=result_tables.get("format", "markdown"),
+                            max_tokens=result_tables.get("max_tokens", DEFAULT_MAX_TOKENS),
+                            min_rows=result_tables.get("min_rows", DEFAULT_MIN_ROWS),
+                            max_tables=result_tables.get("max_tables", 64))
+    return result_tables